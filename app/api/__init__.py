@@ -1,4 +1,5 @@
 # app/api/__init__.py
 from .auth import router as auth_router
 from .documents import router as documents_router
-from .users import router as users_router
\ No newline at end of file
+from .users import router as users_router
+from .metrics import router as metrics_router
\ No newline at end of file
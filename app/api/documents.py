@@ -1,79 +1,278 @@
 # app/api/documents.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-import os
-from typing import List
-from app.db.session import get_db
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+import asyncio
+import base64
+import datetime
+import json
+import uuid
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, get_db
 from app.models.document import Document
-from app.schemas.document import Document as DocumentSchema, DocumentCreate
-from app.services.document_processor import DocumentProcessor
-from app.services.llm_service import LLMService
+from app.models.document_blob import DocumentBlob
+from app.schemas.document import DocumentContent, DocumentPage, DocumentSearchResult, DocumentUploadResponse
+from app.services.document_processor import (
+    DocumentProcessor, attach_document, extraction_failed_task, process_document_task, register_upload,
+    release_document
+)
+from app.services.progress import ProgressTracker
+from app.services.retrieval import build_library_context, build_question_context
+from app.services.search import search_documents
+from app.services.vector_store import VectorStore
+from fastapi.concurrency import run_in_threadpool
+from app.services.llm_service import LLMService, get_llm_service
 from app.api.auth import get_current_user_id
 
 router = APIRouter()
 
-@router.post("/upload", response_model=DocumentSchema)
+async def _get_owned_document(db: AsyncSession, document_id: int, owner_id: int) -> Optional[Document]:
+    # El blob se carga junto al documento: con AsyncSession no hay carga perezosa.
+    # Su contenido es diferido y no se trae
+    result = await db.execute(
+        select(Document)
+        .options(selectinload(Document.blob))
+        .where(Document.id == document_id, Document.owner_id == owner_id)
+    )
+    return result.scalars().first()
+
+def _ensure_ready(document: Document):
+    # Hasta que el pipeline termina no hay fragmentos ni texto: el LLM
+    # contestaría sin contexto
+    if document.status == "ready":
+        return
+    progress_url = f"{settings.API_V1_STR}/documents/documents/{document.id}/progress"
+    if document.status == "failed":
+        detail = "El procesamiento del documento falló; vuelve a subirlo para reintentarlo"
+    else:
+        detail = "El documento todavía se está procesando"
+    raise HTTPException(
+        status_code=409,
+        detail={"message": detail, "status": document.status, "status_url": progress_url}
+    )
+
+def _encode_cursor(created_at: datetime.datetime, document_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{document_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, document_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(created_at), int(document_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.post("/upload", response_model=DocumentUploadResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
     try:
-        # Procesar documento y generar resumen
-        content, file_path, summary = await DocumentProcessor.process_document(file)
-        
-        document = Document(
-            title=file.filename,
-            content=content,
-            file_path=file_path,
-            summary=summary,
-            owner_id=current_user_id
+        # Solo se guarda el fichero: extracción, embeddings y resumen van en Celery,
+        # así que la latencia no depende del tamaño del documento ni del LLM
+        content_hash, tmp_path, file_path = await DocumentProcessor.save_upload(file)
+        document, needs_processing = await register_upload(
+            db, file.filename, current_user_id, content_hash, tmp_path, file_path
         )
-        
-        db.add(document)
-        db.commit()
-        db.refresh(document)
-        return document
+
+        tracker = ProgressTracker()
+        if needs_processing:
+            # El estado "queued" se escribe antes de encolar: un worker rápido
+            # podría haber avanzado ya y no debe quedar pisado. Se borra antes
+            # el progreso (y el error) de un intento fallido anterior
+            job_id = str(uuid.uuid4())
+            await run_in_threadpool(tracker.clear_progress, content_hash)
+            await run_in_threadpool(tracker.update, content_hash, status="processing", stage="queued", job_id=job_id)
+            process_document_task.apply_async(
+                (content_hash, current_user_id),
+                task_id=job_id,
+                link_error=extraction_failed_task.s(content_hash)
+            )
+        else:
+            # Contenido ya conocido: se reutiliza texto, resumen, fragmentos y embeddings
+            await run_in_threadpool(attach_document, document.id, current_user_id, content_hash)
+            job_id = (await run_in_threadpool(tracker.get, content_hash)).get("job_id")
+        return {
+            "job_id": job_id,
+            "status_url": f"{settings.API_V1_STR}/documents/documents/{document.id}/progress",
+            "document": document
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error al procesar el documento: {str(e)}"
         )
 
-@router.get("/documents", response_model=List[DocumentSchema])
+@router.get("/documents", response_model=DocumentPage)
 async def get_documents(
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    # Paginación por clave (created_at, id) sobre ix_documents_owner_id_created_at:
+    # cada página cuesta lo mismo sin importar cuántas la preceden
+    query = (
+        select(Document)
+        .options(selectinload(Document.blob))
+        .where(Document.owner_id == current_user_id)
+        .order_by(Document.created_at, Document.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(Document.created_at, Document.id) > _decode_cursor(cursor))
+    documents = (await db.execute(query)).scalars().all()
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = _encode_cursor(documents[-1].created_at, documents[-1].id)
+    return {"items": documents, "next_cursor": next_cursor}
+
+@router.get("/search", response_model=List[DocumentSearchResult])
+async def search_library(
+    q: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    # Búsqueda de texto completo en Postgres, sin pasar por el LLM
+    return await search_documents(db, current_user_id, q, limit)
+
+@router.get("/documents/{document_id}/content", response_model=DocumentContent)
+async def get_document_content(
+    document_id: int,
+    db: AsyncSession = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
-    documents = db.query(Document).filter(Document.owner_id == current_user_id).all()
-    return documents
+    row = (await db.execute(
+        select(Document.id, Document.title, DocumentBlob.content)
+        .outerjoin(DocumentBlob, DocumentBlob.sha256 == Document.content_hash)
+        .where(Document.id == document_id, Document.owner_id == current_user_id)
+    )).first()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    return {"id": row.id, "title": row.title, "content": row.content}
+
+@router.get("/documents/{document_id}/progress")
+async def get_document_progress(
+    document_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    document = await _get_owned_document(db, document_id, current_user_id)
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    progress = await run_in_threadpool(ProgressTracker().get, document.content_hash)
+    return _progress_report(document.id, progress, await _blob_state(document.content_hash, progress))
+
+@router.get("/documents/{document_id}/progress/stream")
+async def stream_document_progress(
+    document_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    document = await _get_owned_document(db, document_id, current_user_id)
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    tracker = ProgressTracker()
+
+    async def event_stream():
+        # Se consulta Redis cada segundo y solo se emite cuando algo cambia
+        last = None
+        while not await request.is_disconnected():
+            progress = await run_in_threadpool(tracker.get, document.content_hash)
+            report = _progress_report(document.id, progress, await _blob_state(document.content_hash, progress))
+            if report != last:
+                yield f"event: progress\ndata: {json.dumps(report)}\n\n"
+                last = report
+            if report["status"] in ("ready", "failed"):
+                yield "event: done\ndata: {}\n\n"
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _blob_state(content_hash: str, progress: dict) -> dict:
+    """Estado del contenido en la base de datos, solo si Redis ya no lo tiene.
+
+    Se lee con una sesión propia en cada llamada: el stream de progreso dura
+    más que cualquier objeto cargado al empezar.
+    """
+    if progress:
+        return {}
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(DocumentBlob.status, DocumentBlob.error, DocumentBlob.summary.is_not(None))
+            .where(DocumentBlob.sha256 == content_hash)
+        )).first()
+    if row is None:
+        return {}
+    return {"status": row[0], "error": row[1], "summary_ready": row[2]}
+
+def _progress_report(document_id: int, progress: dict, blob: dict) -> dict:
+    # Redis tiene el estado al día; la base de datos cubre el caso en que ya expiró
+    status = progress.get("status") or blob.get("status")
+    if progress:
+        summary_ready = progress.get("summary_stage") == "done"
+    else:
+        summary_ready = bool(blob.get("summary_ready"))
+    return {
+        "document_id": document_id,
+        "job_id": progress.get("job_id"),
+        "status": status,
+        "stage": progress.get("stage", "done" if status == "ready" else status),
+        "error": progress.get("error") or blob.get("error"),
+        "pages_total": int(progress.get("pages_total", 0)),
+        "pages_done": int(progress.get("pages_done", 0)),
+        "chunks": int(progress.get("chunks", 0)),
+        "summary_stage": progress.get("summary_stage", "done" if summary_ready else "pending"),
+        "summary_total_chunks": int(progress.get("summary_total_chunks", 0)),
+        "summary_done_chunks": int(progress.get("summary_done_chunks", 0)),
+        "summary_ready": summary_ready
+    }
 
 @router.delete("/documents/{document_id}")
 async def delete_document(
     document_id: int,
-    db: Session = Depends(get_db),
-    current_user_id: int = Depends(get_current_user_id)
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id),
+    llm_service: LLMService = Depends(get_llm_service)
 ):
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.owner_id == current_user_id
-    ).first()
+    document = await _get_owned_document(db, document_id, current_user_id)
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        # Delete the physical file if it exists
-        if document.file_path and os.path.exists(document.file_path):
-            os.remove(document.file_path)
-        
-        # Delete from database
-        db.delete(document)
-        db.commit()
+        # Delete from database; the shared file and artifacts go with the last reference
+        await release_document(db, document)
+
+        # Invalidate cached LLM answers and this user's index rows for the document
+        await llm_service.invalidate_document(document_id)
+        await run_in_threadpool(VectorStore().delete, current_user_id, document_id)
         
         return {"message": "Document deleted successfully"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Error deleting document: {str(e)}"
@@ -83,18 +282,108 @@ async def delete_document(
 async def ask_question(
     document_id: int,
     question: str,
-    db: Session = Depends(get_db),
-    current_user_id: int = Depends(get_current_user_id)
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id),
+    llm_service: LLMService = Depends(get_llm_service)
 ):
-    document = db.query(Document).filter(
-        Document.id == document_id,
-        Document.owner_id == current_user_id
-    ).first()
+    document = await _get_owned_document(db, document_id, current_user_id)
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
-    
-    # Crear instancia de LLMService
-    llm_service = LLMService()
-    answer = await llm_service.answer_question(document.content, question)
-    return {"answer": answer}
\ No newline at end of file
+
+    _ensure_ready(document)
+    # Solo entra en el prompt lo más relevante que quepa en el presupuesto de tokens
+    context, question_vector = await build_question_context(db, document, question, llm_service)
+    answer = await llm_service.answer_question(
+        context.text, question, document_id=document.id, user_id=current_user_id,
+        question_vector=question_vector
+    )
+    return {"answer": answer, "context": context.report()}
+
+@router.post("/library/ask")
+async def ask_library_stream(
+    question: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    # Solo id y título: el contenido de los documentos no se carga
+    rows = (await db.execute(
+        select(Document.id, Document.title, Document.content_hash).where(Document.owner_id == current_user_id)
+    )).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail="No documents found")
+
+    llm_service.ensure_capacity()
+    documents = {document_id: (title, content_hash) for document_id, title, content_hash in rows}
+    context, citations = await build_library_context(db, current_user_id, documents, question, llm_service)
+    if not citations:
+        raise HTTPException(status_code=404, detail="No indexed content matches the question")
+
+    async def event_stream():
+        tokens = llm_service.stream_library_answer(context, question, user_id=current_user_id)
+        try:
+            yield f"event: citations\ndata: {json.dumps(citations)}\n\n"
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            else:
+                yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error en streaming de respuesta: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/ask/{document_id}/stream")
+async def ask_question_stream(
+    document_id: int,
+    question: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    document = await _get_owned_document(db, document_id, current_user_id)
+
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    _ensure_ready(document)
+    # Rechazar antes de abrir el stream si la cola del LLM está llena
+    llm_service.ensure_capacity()
+    context, question_vector = await build_question_context(db, document, question, llm_service)
+
+    async def event_stream():
+        # Al salir del generador se cierra el stream de Ollama y se cancela la generación
+        tokens = llm_service.stream_answer(
+            context.text, question, document_id=document_id, user_id=current_user_id,
+            question_vector=question_vector
+        )
+        try:
+            yield f"event: context\ndata: {json.dumps(context.report())}\n\n"
+            async for token in tokens:
+                if await request.is_disconnected():
+                    break
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            else:
+                yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error en streaming de respuesta: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
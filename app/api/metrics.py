@@ -0,0 +1,23 @@
+# app/api/metrics.py
+from fastapi import APIRouter, Depends
+from app.db.pool import pool_stats
+from app.db.session import async_engine, engine
+from app.services.llm_service import LLMService, get_llm_service
+
+router = APIRouter()
+
+@router.get("/llm")
+async def get_llm_metrics(llm_service: LLMService = Depends(get_llm_service)):
+    return {
+        "cache": llm_service.cache.stats() if llm_service.cache is not None else None,
+        "semantic_cache": llm_service.semantic_cache.stats() if llm_service.semantic_cache is not None else None,
+        "single_flight": llm_service.flights.stats(),
+        "admission": llm_service.admission.stats()
+    }
+
+@router.get("/db")
+async def get_db_metrics():
+    return {
+        "async": pool_stats(async_engine.pool),
+        "sync": pool_stats(engine.pool)
+    }
@@ -1,6 +1,7 @@
 # app/api/users.py
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import User as UserSchema
@@ -17,23 +18,23 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 async def update_user(
     user_update: UserSchema,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if user_update.email != current_user.email:
-        existing_user = db.query(User).filter(User.email == user_update.email).first()
+        existing_user = (await db.execute(select(User).where(User.email == user_update.email))).scalars().first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
     
     current_user.email = user_update.email
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
 @router.delete("/me")
 async def delete_user(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    db.delete(current_user)
-    db.commit()
+    await db.delete(current_user)
+    await db.commit()
     return {"message": "User deleted successfully"}
\ No newline at end of file
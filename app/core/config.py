@@ -16,6 +16,16 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "Leuname9991gge")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "ragsaas")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    SQLALCHEMY_ASYNC_DATABASE_URI: Optional[str] = None
+
+    # Pool de conexiones por proceso (API y cada worker de Celery)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Detrás de PgBouncer en modo transacción: sin pool propio ni sentencias preparadas en caché
+    DB_PGBOUNCER: bool = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
     
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "aja")
     ALGORITHM: str = "HS256"
@@ -27,10 +37,78 @@ class Settings(BaseSettings):
     # Configuración de Ollama
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "llama2")
+    OLLAMA_EMBEDDING_MODEL: str = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
     OLLAMA_TIMEOUT: int = int(os.getenv("OLLAMA_TIMEOUT", "30"))
     OLLAMA_MAX_RETRIES: int = int(os.getenv("OLLAMA_MAX_RETRIES", "3"))
     OLLAMA_RETRY_DELAY: int = int(os.getenv("OLLAMA_RETRY_DELAY", "1"))
+    OLLAMA_MAX_CONNECTIONS: int = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+    # Ventana de contexto que se pide a Ollama (num_ctx); el prompt debe caber entero
+    OLLAMA_NUM_CTX: int = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+
+    # Presupuesto de tokens del contexto del documento en answer_question
+    LLM_CONTEXT_BUDGET: int = int(os.getenv("LLM_CONTEXT_BUDGET", "2048"))
+    LLM_CONTEXT_CHUNK_TOKENS: int = int(os.getenv("LLM_CONTEXT_CHUNK_TOKENS", "256"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+    # Almacén de embeddings por fragmento para recuperar contexto
+    VECTOR_STORE_DIR: str = os.getenv("VECTOR_STORE_DIR", "uploads/vectors")
+    VECTOR_STORE_DTYPE: str = os.getenv("VECTOR_STORE_DTYPE", "int8")
+    VECTOR_SEARCH_BATCH_ROWS: int = int(os.getenv("VECTOR_SEARCH_BATCH_ROWS", "65536"))
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+    # Candidatos que aporta cada recuperador (BM25 y vectorial) antes de fusionar con RRF
+    RETRIEVAL_CANDIDATES: int = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+    RETRIEVAL_RRF_K: int = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    # Fragmentos que se insertan, indexan y pasan a embeddings de una vez al procesar un contenido
+    INDEX_BATCH_SIZE: int = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+    # Control de admisión frente a Ollama
+    LLM_MAX_IN_FLIGHT: int = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    LLM_QUEUE_TIMEOUT: int = int(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+    # 0 = todos los slots menos uno, que queda libre para preguntas interactivas
+    LLM_BACKGROUND_MAX_IN_FLIGHT: Optional[int] = int(os.getenv("LLM_BACKGROUND_MAX_IN_FLIGHT", "0")) or None
+    LLM_INTERACTIVE_WEIGHT: int = int(os.getenv("LLM_INTERACTIVE_WEIGHT", "4"))
+    # Los límites anteriores valen para toda la instalación (API y workers) a través de Redis
+    LLM_SHARED_SLOTS_ENABLED: bool = os.getenv("LLM_SHARED_SLOTS_ENABLED", "true").lower() == "true"
+    # Caducidad de un slot compartido si su proceso muere sin liberarlo
+    LLM_SLOT_LEASE: int = int(os.getenv("LLM_SLOT_LEASE", "300"))
+
+    # Caché de respuestas del LLM
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_REDIS_ENABLED: bool = os.getenv("LLM_CACHE_REDIS_ENABLED", "true").lower() == "true"
+    LLM_CACHE_REDIS_DB: int = int(os.getenv("LLM_CACHE_REDIS_DB", "1"))
+
+    # Agrupación de peticiones idénticas en curso (single-flight)
+    SINGLE_FLIGHT_REDIS_ENABLED: bool = os.getenv("SINGLE_FLIGHT_REDIS_ENABLED", "true").lower() == "true"
+    SINGLE_FLIGHT_LOCK_TTL: int = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", "120"))
+    SINGLE_FLIGHT_WAIT_TIMEOUT: int = int(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", "120"))
+
+    # Caché semántica de preguntas (similitud coseno de embeddings)
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_MAX_PER_DOCUMENT: int = int(os.getenv("SEMANTIC_CACHE_MAX_PER_DOCUMENT", "5000"))
     
+    # Resumen map-reduce en Celery
+    SUMMARY_CHUNK_SIZE: int = int(os.getenv("SUMMARY_CHUNK_SIZE", "4000"))
+    SUMMARY_REDUCE_FANOUT: int = int(os.getenv("SUMMARY_REDUCE_FANOUT", "8"))
+
+    # Subidas: se escriben a disco por bloques y se cortan al pasar del máximo
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    UPLOAD_MAX_SIZE: int = int(os.getenv("UPLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+    # Extracción de texto en los workers de Celery, con plazo y tope de memoria por tarea
+    EXTRACTION_TIMEOUT: int = int(os.getenv("EXTRACTION_TIMEOUT", "60"))
+    EXTRACTION_MEMORY_LIMIT_MB: int = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "1024"))
+    EXTRACTION_PDF_PAGES_PER_JOB: int = int(os.getenv("EXTRACTION_PDF_PAGES_PER_JOB", "200"))
+
+    # Búsqueda de texto completo en Postgres (columnas tsvector generadas con índice GIN)
+    SEARCH_LANGUAGES: str = os.getenv("SEARCH_LANGUAGES", "spanish,english")
+    SEARCH_MAX_CHARS: int = int(os.getenv("SEARCH_MAX_CHARS", "500000"))
+
     # Frontend Configuration
     FRONTEND_URL: str = "http://localhost:8550"
     
@@ -46,9 +124,12 @@ class Settings(BaseSettings):
             return {
                 "base_url": self.OLLAMA_BASE_URL,
                 "model": self.OLLAMA_MODEL,
+                "embedding_model": self.OLLAMA_EMBEDDING_MODEL,
                 "timeout": self.OLLAMA_TIMEOUT,
                 "max_retries": self.OLLAMA_MAX_RETRIES,
-                "retry_delay": self.OLLAMA_RETRY_DELAY
+                "retry_delay": self.OLLAMA_RETRY_DELAY,
+                "max_connections": self.OLLAMA_MAX_CONNECTIONS,
+                "num_ctx": self.OLLAMA_NUM_CTX
             }
         except Exception as e:
             print(f"Error en la configuración de Ollama: {str(e)}")
@@ -62,4 +143,8 @@ settings = Settings()
 settings.SQLALCHEMY_DATABASE_URI = (
     f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
     f"@{settings.POSTGRES_SERVER}/{settings.POSTGRES_DB}"
+)
+settings.SQLALCHEMY_ASYNC_DATABASE_URI = (
+    f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+    f"@{settings.POSTGRES_SERVER}/{settings.POSTGRES_DB}"
 )
\ No newline at end of file
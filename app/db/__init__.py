@@ -1,5 +1,8 @@
 # app/db/__init__.py
 from app.models.user import User
 from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+from app.models.document_chunk import DocumentChunk
+from app.models.document_page import DocumentPage
 from app.db.base import Base
 from app.db.session import SessionLocal, get_db
\ No newline at end of file
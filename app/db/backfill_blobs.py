@@ -0,0 +1,130 @@
+# app/db/backfill_blobs.py
+"""Migración única de documentos anteriores a la deduplicación por contenido.
+
+Antes cada fila de documents guardaba su propio texto y resumen. Este script
+crea las tablas nuevas, añade a las existentes las columnas que les falten y, para
+cada documento sin content_hash, calcula el SHA-256 de su fichero, crea (o
+reutiliza) el DocumentBlob con el texto y el resumen y lo enlaza. Se puede
+relanzar: solo toca documentos sin content_hash.
+
+    python -m app.db.backfill_blobs            # migra
+    python -m app.db.backfill_blobs --reindex  # migra y encola la indexación
+
+Las columnas antiguas documents.content y documents.summary no se borran;
+cuando se haya comprobado la migración se pueden eliminar a mano.
+"""
+import argparse
+import hashlib
+import os
+from typing import List, Optional
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateColumn
+import app.db  # noqa: F401 - registra todos los modelos
+from app.core.config import settings
+from app.db.base import Base
+from app.db.session import engine
+from app.models.document import Document
+from app.models.document_chunk import DocumentChunk
+
+def hash_file(path: str) -> Optional[str]:
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def add_missing_columns(connection: Connection) -> List[str]:
+    """Añade a las tablas ya existentes las columnas del modelo que no tienen en la base de datos."""
+    added = []
+    for table in (Document.__table__, DocumentChunk.__table__):
+        existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            added.append(f"{table.name}.{column.name}")
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    if "documents.content_hash" in added:
+        connection.execute(text(
+            "ALTER TABLE documents ADD CONSTRAINT documents_content_hash_fkey "
+            "FOREIGN KEY (content_hash) REFERENCES document_blobs (sha256)"
+        ))
+    return added
+
+def backfill(connection: Connection) -> List[tuple]:
+    """Enlaza cada documento sin content_hash con su blob. Devuelve los blobs creados (hash, ruta)."""
+    columns = {column["name"] for column in inspect(connection).get_columns("documents")}
+    if not {"content", "summary"} <= columns:
+        print("La tabla documents no tiene las columnas antiguas: no hay nada que migrar")
+        return []
+    rows = connection.execute(text(
+        "SELECT id, file_path, content, summary FROM documents WHERE content_hash IS NULL ORDER BY id"
+    )).all()
+    created = []
+    for row in rows:
+        content_hash = hash_file(row.file_path)
+        if content_hash is None:
+            # Sin fichero el texto es lo único que queda para identificar el contenido
+            content_hash = hashlib.sha256((row.content or "").encode("utf-8")).hexdigest()
+            print(f"Documento {row.id}: no existe {row.file_path}, se usa el hash del texto")
+        blob = connection.execute(
+            text("SELECT file_path FROM document_blobs WHERE sha256 = :sha256 FOR UPDATE"),
+            {"sha256": content_hash}
+        ).first()
+        if blob is None:
+            connection.execute(
+                text(
+                    "INSERT INTO document_blobs (sha256, file_path, content, summary, status, error, ref_count, created_at) "
+                    "VALUES (:sha256, :file_path, :content, :summary, :status, :error, 1, now())"
+                ),
+                {
+                    "sha256": content_hash,
+                    "file_path": row.file_path,
+                    "content": row.content,
+                    "summary": row.summary,
+                    "status": "ready" if row.content is not None else "failed",
+                    "error": None if row.content is not None else "Documento migrado sin texto extraído"
+                }
+            )
+            file_path = row.file_path
+            created.append((content_hash, file_path))
+        else:
+            # Mismo contenido que otro documento: comparten el blob y su fichero
+            connection.execute(
+                text("UPDATE document_blobs SET ref_count = ref_count + 1 WHERE sha256 = :sha256"),
+                {"sha256": content_hash}
+            )
+            file_path = blob.file_path
+        connection.execute(
+            text("UPDATE documents SET content_hash = :sha256, file_path = :file_path WHERE id = :id"),
+            {"sha256": content_hash, "file_path": file_path, "id": row.id}
+        )
+    print(f"Documentos migrados: {len(rows)}, contenidos distintos nuevos: {len(created)}")
+    return created
+
+def main(reindex: bool = False):
+    # Tablas nuevas (document_blobs, document_chunks, document_pages)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        added = add_missing_columns(connection)
+        if added:
+            print(f"Columnas añadidas: {', '.join(added)}")
+        created = backfill(connection)
+
+    if reindex:
+        # Fragmentos, BM25 y embeddings por contenido; también regenera el resumen
+        from app.services.document_processor import index_content_task
+        for content_hash, file_path in created:
+            index_content_task.delay(content_hash, file_path)
+        print(f"Indexación encolada para {len(created)} contenidos")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra los documentos existentes a contenidos deduplicados")
+    parser.add_argument("--reindex", action="store_true", help="encola la indexación de los contenidos migrados")
+    args = parser.parse_args()
+    main(reindex=args.reindex)
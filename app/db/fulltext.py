@@ -0,0 +1,27 @@
+# app/db/fulltext.py
+import re
+from typing import List, Optional
+from app.core.config import settings
+
+def search_configs() -> List[str]:
+    """Configuraciones de Postgres (text search) con las que se indexa y se busca."""
+    configs = [name.strip() for name in settings.SEARCH_LANGUAGES.split(",") if name.strip()]
+    for name in configs:
+        # Van dentro del DDL de las columnas generadas: solo identificadores simples
+        if not re.fullmatch(r"[a-z_]+", name):
+            raise ValueError(f"Configuración de búsqueda no válida: {name}")
+    return configs or ["simple"]
+
+def tsvector_sql(column: str, weight: str, max_chars: Optional[int] = None) -> str:
+    """Expresión SQL de una columna generada tsvector: un vector por idioma, concatenados.
+
+    Cada idioma aporta su propia raíz de las palabras ("documentos" -> "document"
+    en español e inglés), así que una consulta en cualquiera de ellos encuentra
+    el texto. `max_chars` acota el texto indexado: un tsvector no puede pasar de 1 MB.
+    """
+    text = f"coalesce({column}, '')"
+    if max_chars:
+        text = f"left({text}, {int(max_chars)})"
+    return " || ".join(
+        f"setweight(to_tsvector('{config}', {text}), '{weight}')" for config in search_configs()
+    )
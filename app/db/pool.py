@@ -0,0 +1,94 @@
+# app/db/pool.py
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+class PoolMetrics:
+    """Contadores de un pool de conexiones: esperas, desbordes y conexiones caídas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.invalidated = 0
+
+    def record_checkout(self, wait: float, overflowed: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self, wait: float):
+        with self._lock:
+            self.timeouts += 1
+            self.max_wait_time = max(self.max_wait_time, wait)
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "avg_wait_time": self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+            "max_wait_time": self.max_wait_time,
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "invalidated": self.invalidated
+        }
+
+class _MeteredPool:
+    """Mide cuánto se espera por una conexión y cuándo el pool pasa de pool_size.
+
+    Las conexiones invalidadas son sobre todo las que pre-ping descarta tras
+    un reinicio de Postgres. Los contadores sobreviven a engine.dispose().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        event.listen(self, "invalidate", lambda *_: self.metrics.record_invalidation())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        overflow = self.overflow()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start, self.overflow() > max(overflow, 0))
+        return connection
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    pass
+
+class MeteredAsyncAdaptedQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+def pool_stats(pool: Pool) -> dict:
+    """Estado actual y contadores del pool, o solo su tipo si no es medible (NullPool)."""
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0)
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+    return stats
@@ -1,15 +1,52 @@
 # app/db/session.py
-from typing import Generator
+import uuid
+from typing import AsyncGenerator
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
+from app.db.pool import MeteredAsyncAdaptedQueuePool, MeteredQueuePool
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI)
+def _engine_options(poolclass) -> dict:
+    if settings.DB_PGBOUNCER:
+        # PgBouncer ya agrupa las conexiones: un pool aquí solo retendría conexiones del servidor
+        return {"poolclass": NullPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        # Descarta conexiones muertas (p. ej. tras reiniciar Postgres) antes de usarlas
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+
+def _async_connect_args() -> dict:
+    if not settings.DB_PGBOUNCER:
+        return {}
+    # En modo transacción cada sentencia puede ir a otra conexión del servidor:
+    # sin caché de sentencias preparadas y con nombres únicos para no chocar
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4().hex}__"
+    }
+
+# Síncrono: lo usan los workers de Celery y la creación de tablas al arrancar
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, **_engine_options(MeteredQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db() -> Generator:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+# Asíncrono (asyncpg): lo usa la API para no bloquear el event loop en cada consulta
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI,
+    connect_args=_async_connect_args(),
+    **_engine_options(MeteredAsyncAdaptedQueuePool)
+)
+# Sin expirar al hacer commit: los objetos se serializan en la respuesta después,
+# y una recarga implícita fuera de un await no está permitida con AsyncSession
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
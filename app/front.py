@@ -268,12 +268,21 @@ def main(page: ft.Page):
     async def load_documents():
         nonlocal documents_list
         try:
-            response = requests.get(
-                f"{API_URL}/documents/documents",
-                headers={'Authorization': f'Bearer {token}'}
-            )
-            response.raise_for_status()
-            documents_list = response.json()
+            # The listing is paginated; follow the cursor until the last page
+            documents_list = []
+            params = {'limit': 200}
+            while True:
+                response = requests.get(
+                    f"{API_URL}/documents/documents",
+                    headers={'Authorization': f'Bearer {token}'},
+                    params=params
+                )
+                response.raise_for_status()
+                page_data = response.json()
+                documents_list.extend(page_data['items'])
+                if not page_data.get('next_cursor'):
+                    break
+                params['cursor'] = page_data['next_cursor']
             
             # Update dropdown
             documents_dropdown.options = [
@@ -419,7 +428,7 @@ def main(page: ft.Page):
             
             # Update documents list
             await load_documents()
-            show_snackbar("File uploaded successfully!")
+            show_snackbar("File uploaded! Processing in the background...")
             
         except Exception as e:
             progress_ring.visible = False
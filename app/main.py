@@ -1,18 +1,29 @@
 # app/main.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api import auth, documents, users  # Changed import
+from app.api import auth, documents, users, metrics  # Changed import
 from app.db.base import Base
 from app.db.session import engine
+from app.services.llm_service import init_llm_service, close_llm_service
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único cliente LLM por proceso, con su pool de conexiones a Ollama
+    init_llm_service()
+    yield
+    await close_llm_service()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -23,10 +34,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Rechaza por Content-Length antes de que se lea el cuerpo de la subida;
+    # DocumentProcessor.save_upload vuelve a contar los bytes por si no viene
+    length = request.headers.get("content-length")
+    if request.method == "POST" and request.url.path.endswith("/documents/upload") \
+            and length and length.isdigit() and int(length) > settings.UPLOAD_MAX_SIZE + 64 * 1024:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"El archivo supera el tamaño máximo de {settings.UPLOAD_MAX_SIZE} bytes"}
+        )
+    return await call_next(request)
+
 # Include routers
 app.include_router(auth.router, prefix=settings.API_V1_STR + "/auth", tags=["auth"])
 app.include_router(documents.router, prefix=settings.API_V1_STR + "/documents", tags=["documents"])
 app.include_router(users.router, prefix=settings.API_V1_STR + "/users", tags=["users"])
+app.include_router(metrics.router, prefix=settings.API_V1_STR + "/metrics", tags=["metrics"])
 
 if __name__ == "__main__":
     import uvicorn
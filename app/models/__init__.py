@@ -1,3 +1,6 @@
 # models/__init__.py
 from .user import User
 from .document import Document
+from .document_blob import DocumentBlob
+from .document_chunk import DocumentChunk
+from .document_page import DocumentPage
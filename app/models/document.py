@@ -1,17 +1,39 @@
 # app/models/document.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, String, ForeignKey, DateTime, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 import datetime
 from app.db.base import Base
+from app.db.fulltext import tsvector_sql
 
 class Document(Base):
     __tablename__ = "documents"
+    # Listado paginado de la biblioteca de un usuario por (created_at, id)
+    __table_args__ = (
+        Index("ix_documents_owner_id_created_at", "owner_id", "created_at"),
+        Index("ix_documents_title_vector", "title_vector", postgresql_using="gin"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
-    content = Column(Text)
     file_path = Column(String)
-    summary = Column(Text, nullable=True)
+    # Texto, resumen, fragmentos y embeddings se guardan una vez por contenido
+    content_hash = Column(String(64), ForeignKey("document_blobs.sha256"), index=True)
+    # El título pesa más que el contenido al ordenar los resultados de búsqueda
+    title_vector = deferred(Column(TSVECTOR, Computed(tsvector_sql("title", "A"), persisted=True)))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="documents")
\ No newline at end of file
+    owner = relationship("User", back_populates="documents")
+    blob = relationship("DocumentBlob", back_populates="documents")
+
+    @property
+    def content(self):
+        return self.blob.content if self.blob is not None else None
+
+    @property
+    def summary(self):
+        return self.blob.summary if self.blob is not None else None
+
+    @property
+    def status(self):
+        return self.blob.status if self.blob is not None else None
@@ -0,0 +1,27 @@
+# app/models/document_blob.py
+from sqlalchemy import Column, Computed, Index, Integer, String, Text, DateTime
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
+import datetime
+from app.core.config import settings
+from app.db.base import Base
+from app.db.fulltext import tsvector_sql
+
+class DocumentBlob(Base):
+    """Contenido de un fichero subido, compartido por todos los documentos con el mismo SHA-256."""
+    __tablename__ = "document_blobs"
+    __table_args__ = (Index("ix_document_blobs_search_vector", "search_vector", postgresql_using="gin"),)
+
+    sha256 = Column(String(64), primary_key=True)
+    file_path = Column(String)
+    # El texto completo solo se carga cuando se pide: listados y comprobaciones no lo necesitan
+    content = deferred(Column(Text))
+    summary = Column(Text, nullable=True)
+    # processing -> ready | failed, lo actualiza el pipeline de Celery
+    status = Column(String, default="processing", nullable=False)
+    error = Column(Text, nullable=True)
+    # La calcula Postgres al guardar el contenido; nunca se carga en Python
+    search_vector = deferred(Column(TSVECTOR, Computed(tsvector_sql("content", "B", settings.SEARCH_MAX_CHARS), persisted=True)))
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    documents = relationship("Document", back_populates="blob")
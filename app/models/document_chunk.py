@@ -0,0 +1,19 @@
+# app/models/document_chunk.py
+from sqlalchemy import Column, Computed, ForeignKey, Integer, String, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+from app.db.base import Base
+from app.db.fulltext import tsvector_sql
+
+class DocumentChunk(Base):
+    """Fragmento de un contenido tal como se indexa y se cita, con sus offsets en el texto."""
+    __tablename__ = "document_chunks"
+
+    content_hash = Column(String(64), ForeignKey("document_blobs.sha256", ondelete="CASCADE"), primary_key=True)
+    ordinal = Column(Integer, primary_key=True)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    tokens = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    # Para los fragmentos de la búsqueda: ts_headline solo recorre el fragmento que coincide
+    search_vector = deferred(Column(TSVECTOR, Computed(tsvector_sql("text", "B"), persisted=True)))
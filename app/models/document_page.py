@@ -0,0 +1,15 @@
+# app/models/document_page.py
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Text
+from app.db.base import Base
+
+class DocumentPage(Base):
+    """Página de un PDF (empezando en 1) con su posición en el contenido extraído."""
+    __tablename__ = "document_pages"
+    # Página que contiene un offset: la última que empieza antes de él
+    __table_args__ = (Index("ix_document_pages_content_hash_start_offset", "content_hash", "start_offset"),)
+
+    content_hash = Column(String(64), ForeignKey("document_blobs.sha256", ondelete="CASCADE"), primary_key=True)
+    number = Column(Integer, primary_key=True)
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
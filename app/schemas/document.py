@@ -1,21 +1,51 @@
 # app/schemas/document.py
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class DocumentBase(BaseModel):
     title: str
-    content: Optional[str] = None
 
 class DocumentCreate(DocumentBase):
-    pass
+    content: Optional[str] = None
 
 class Document(DocumentBase):
+    """Documento tal como lo ve su dueño.
+
+    Ni la ruta interna del fichero (uploads/{sha256}.ext) ni el contenido
+    completo, que se pide aparte a /documents/{id}/content.
+    """
     id: int
-    file_path: str
     summary: Optional[str] = None
+    content_hash: Optional[str] = None
+    status: Optional[str] = None
     created_at: datetime
     owner_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class DocumentListItem(Document):
+    """Documento sin su contenido, para listados."""
+
+class DocumentPage(BaseModel):
+    items: List[DocumentListItem]
+    next_cursor: Optional[str] = None
+
+class DocumentContent(BaseModel):
+    id: int
+    title: str
+    content: Optional[str] = None
+
+class DocumentSearchResult(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    rank: float
+    # Texto con las coincidencias entre <mark> y </mark>
+    snippet: Optional[str] = None
+
+class DocumentUploadResponse(BaseModel):
+    job_id: Optional[str] = None
+    status_url: str
+    document: DocumentListItem
\ No newline at end of file
@@ -1,3 +1,3 @@
 # services/__init__.py
 from .document_processor import DocumentProcessor
-from .llm_service import LLMService
+from .llm_service import LLMService, get_llm_service
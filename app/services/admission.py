@@ -0,0 +1,352 @@
+# app/services/admission.py
+import asyncio
+import math
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional, Tuple
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+class OverloadedError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Servicio LLM saturado, reintenta en {retry_after} s")
+        self.retry_after = retry_after
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Toma un slot si hay hueco. Un resumen no entra mientras haya preguntas
+# interactivas esperando ni si el fondo ya ocupa sus slots. Los slots son
+# arriendos con caducidad: los de un proceso muerto se liberan solos.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i = 1, 3 do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now)
+end
+if ARGV[4] == 'background' then
+    if redis.call('ZCARD', KEYS[3]) > 0 then return 0 end
+    if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[6]) then return 0 end
+end
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[5]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+if ARGV[4] == 'background' then
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+end
+return 1
+"""
+
+class SharedSlots:
+    """Semáforo en Redis que comparten la API y todos los workers de Celery.
+
+    Cada proceso tiene su AdmissionController, así que por sí solo no limita
+    la carga total contra Ollama: con N workers habría N * max_in_flight
+    generaciones. Este semáforo acota el total del clúster a max_in_flight,
+    con max_background_in_flight como tope de los resúmenes y prioridad para
+    las preguntas interactivas que estén esperando.
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        max_in_flight: int = 4,
+        max_background_in_flight: Optional[int] = None,
+        lease: int = 300,
+        poll_interval: float = 0.05
+    ):
+        self.redis = redis_client
+        self.max_in_flight = max_in_flight
+        if max_background_in_flight is None:
+            max_background_in_flight = max(1, max_in_flight - 1)
+        self.max_background_in_flight = max_background_in_flight
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._acquire = self.redis.register_script(_ACQUIRE_SCRIPT)
+        self._keys = ["llm:slots", "llm:slots:background", "llm:slots:waiting"]
+
+    async def acquire(self, priority: str = INTERACTIVE, timeout: Optional[float] = None) -> Optional[str]:
+        """Espera un slot y devuelve su token, o None si vence `timeout`."""
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waiting_key = self._keys[2]
+        try:
+            while True:
+                now = time.time()
+                if priority == INTERACTIVE:
+                    # Se anuncia la espera para que los resúmenes cedan el paso
+                    await self.redis.zadd(waiting_key, {token: now + 1 + self.poll_interval * 4})
+                acquired = await self._acquire(
+                    keys=self._keys,
+                    args=[now, now + self.lease, token, priority, self.max_in_flight, self.max_background_in_flight]
+                )
+                if acquired:
+                    return token
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            if priority == INTERACTIVE:
+                await self.redis.zrem(waiting_key, token)
+
+    async def release(self, token: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrem(self._keys[0], token)
+            pipe.zrem(self._keys[1], token)
+            await pipe.execute()
+
+    async def in_flight(self) -> int:
+        await self.redis.zremrangebyscore(self._keys[0], "-inf", time.time())
+        return await self.redis.zcard(self._keys[0])
+
+    async def aclose(self):
+        await self.redis.aclose()
+
+class AdmissionController:
+    """Limita las generaciones simultáneas contra Ollama y reparte los turnos.
+
+    Hasta max_in_flight generaciones corren a la vez; las demás esperan como
+    mucho queue_timeout segundos en una cola de tamaño max_queue. Con la cola
+    llena se rechaza al instante con OverloadedError.
+
+    La cola es justa por usuario: dentro de cada prioridad los usuarios se
+    atienden por turnos (round-robin), así que un usuario con 200 subidas no
+    bloquea a los demás. Las preguntas interactivas van antes que los resúmenes
+    en segundo plano, que además nunca ocupan más de max_background_in_flight
+    slots; cada interactive_weight turnos interactivos se cede uno al fondo para
+    que no se quede sin servicio.
+
+    Con `shared` cada generación admitida toma además un slot de SharedSlots,
+    que limita la carga de todos los procesos juntos. Si Redis falla se sigue
+    solo con el límite local.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        max_queue: int = 32,
+        queue_timeout: float = 30,
+        max_background_in_flight: Optional[int] = None,
+        interactive_weight: int = 4,
+        shared: Optional[SharedSlots] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        if max_background_in_flight is None:
+            max_background_in_flight = max(1, max_in_flight - 1)
+        self.max_background_in_flight = max_background_in_flight
+        self.interactive_weight = interactive_weight
+        self.shared = shared
+        self._in_flight = 0
+        self._background_in_flight = 0
+        self._interactive_streak = 0
+        # Por prioridad: usuario -> cola de futuros, en orden de turno
+        self._queues: Dict[str, "OrderedDict[Hashable, Deque[asyncio.Future]]"] = {
+            INTERACTIVE: OrderedDict(),
+            BACKGROUND: OrderedDict()
+        }
+        self._queue_depth = 0
+        # Media móvil del tiempo de generación, usada para estimar Retry-After
+        self._avg_service_time = 5.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.shared_errors = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        shared = None
+        if settings.LLM_SHARED_SLOTS_ENABLED:
+            shared = SharedSlots(
+                aioredis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.LLM_CACHE_REDIS_DB
+                ),
+                max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+                max_background_in_flight=settings.LLM_BACKGROUND_MAX_IN_FLIGHT,
+                lease=settings.LLM_SLOT_LEASE
+            )
+        return cls(
+            max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+            max_queue=settings.LLM_MAX_QUEUE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            max_background_in_flight=settings.LLM_BACKGROUND_MAX_IN_FLIGHT,
+            interactive_weight=settings.LLM_INTERACTIVE_WEIGHT,
+            shared=shared
+        )
+
+    def retry_after(self) -> int:
+        pending = self._queue_depth + 1
+        return max(1, math.ceil(self._avg_service_time * pending / self.max_in_flight))
+
+    def check_capacity(self):
+        if self._in_flight >= self.max_in_flight and self._queue_depth >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise OverloadedError(self.retry_after())
+
+    async def acquire(self, user_key: Hashable = None, priority: str = INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(future, user_key, priority)
+        self._dispatch()
+        if future.done():
+            self.admitted += 1
+            return
+        if self._queue_depth > self.max_queue:
+            self._remove(future, user_key, priority)
+            self.rejected_queue_full += 1
+            raise OverloadedError(self.retry_after())
+
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            # El slot pudo llegar justo al vencer el plazo: se devuelve
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            self.rejected_timeout += 1
+            raise OverloadedError(self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+            self._remove(future, user_key, priority)
+        self.admitted += 1
+
+    def release(self, priority: str = INTERACTIVE):
+        self._in_flight -= 1
+        if priority == BACKGROUND:
+            self._background_in_flight -= 1
+        self._dispatch()
+
+    def _enqueue(self, future: asyncio.Future, user_key: Hashable, priority: str):
+        self._queues[priority].setdefault(user_key, deque()).append(future)
+        self._queue_depth += 1
+
+    def _remove(self, future: asyncio.Future, user_key: Hashable, priority: str):
+        queue = self._queues[priority].get(user_key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            return
+        self._queue_depth -= 1
+        if not queue:
+            del self._queues[priority][user_key]
+
+    def _pop(self, priority: str) -> Optional[asyncio.Future]:
+        users = self._queues[priority]
+        while users:
+            user_key, queue = next(iter(users.items()))
+            future = queue.popleft()
+            self._queue_depth -= 1
+            # El usuario pasa al final de la ronda
+            del users[user_key]
+            if queue:
+                users[user_key] = queue
+            if not future.done():
+                return future
+        return None
+
+    def _next_waiter(self) -> Optional[Tuple[asyncio.Future, str]]:
+        background_allowed = self._background_in_flight < self.max_background_in_flight
+        order = [INTERACTIVE, BACKGROUND]
+        if self._interactive_streak >= self.interactive_weight and background_allowed \
+                and self._queues[BACKGROUND]:
+            order.reverse()
+        for priority in order:
+            if priority == BACKGROUND and not background_allowed:
+                continue
+            future = self._pop(priority)
+            if future is not None:
+                if priority == INTERACTIVE:
+                    self._interactive_streak += 1
+                else:
+                    self._interactive_streak = 0
+                return future, priority
+        return None
+
+    def _dispatch(self):
+        while self._in_flight < self.max_in_flight:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            future, priority = waiter
+            self._in_flight += 1
+            if priority == BACKGROUND:
+                self._background_in_flight += 1
+            future.set_result(None)
+
+    async def _acquire_shared(self, priority: str) -> Optional[str]:
+        # Los resúmenes esperan sin plazo: su cola es la de Celery
+        timeout = self.queue_timeout if priority == INTERACTIVE else None
+        try:
+            token = await self.shared.acquire(priority, timeout=timeout)
+        except Exception as e:
+            print(f"Error tomando slot compartido en Redis: {str(e)}")
+            self.shared_errors += 1
+            return None
+        if token is None:
+            self.rejected_timeout += 1
+            raise OverloadedError(self.retry_after())
+        return token
+
+    async def _release_shared(self, token: str):
+        try:
+            await self.shared.release(token)
+        except Exception as e:
+            print(f"Error liberando slot compartido en Redis: {str(e)}")
+            self.shared_errors += 1
+
+    @asynccontextmanager
+    async def slot(self, user_key: Hashable = None, priority: str = INTERACTIVE):
+        await self.acquire(user_key, priority)
+        token = None
+        try:
+            if self.shared is not None:
+                token = await self._acquire_shared(priority)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                elapsed = time.monotonic() - started
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+                if token is not None:
+                    await self._release_shared(token)
+        finally:
+            self.release(priority)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "background_in_flight": self._background_in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._queue_depth,
+            "interactive_queue_depth": sum(len(q) for q in self._queues[INTERACTIVE].values()),
+            "background_queue_depth": sum(len(q) for q in self._queues[BACKGROUND].values()),
+            "queued_users": len(set(self._queues[INTERACTIVE]) | set(self._queues[BACKGROUND])),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "shared_slots": self.shared is not None,
+            "shared_errors": self.shared_errors,
+            "avg_wait_time": self.total_wait_time / self.queued if self.queued else 0.0,
+            "max_wait_time": self.max_wait_time,
+            "avg_service_time": self._avg_service_time
+        }
+
+    async def aclose(self):
+        if self.shared is not None:
+            await self.shared.aclose()
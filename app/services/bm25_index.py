@@ -0,0 +1,233 @@
+# app/services/bm25_index.py
+import os
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+# Identificadores como "XK-4471" o "v2.3.1" se indexan enteros y por partes
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*", re.UNICODE)
+_COMBINING_RE = re.compile(r"[\u0300-\u036f]")
+# Una URL o un base64 pegado daría un término enorme que nadie va a buscar
+# entero; sus partes sí se indexan
+MAX_TERM_LENGTH = 64
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    if not text.isascii():
+        # "Quién" y "quien" deben dar el mismo término
+        text = _COMBINING_RE.sub("", unicodedata.normalize("NFKD", text))
+    tokens = []
+    for match in _TOKEN_RE.findall(text):
+        if len(match) <= MAX_TERM_LENGTH:
+            tokens.append(match)
+        if not match.isalnum():
+            tokens.extend(
+                part for part in re.split(r"[-./]", match)
+                if part and len(part) <= MAX_TERM_LENGTH
+            )
+    return tokens
+
+class BM25Builder:
+    """Acumula los fragmentos de un contenido, de uno en uno, para BM25Index.write."""
+
+    def __init__(self):
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+
+    def add(self, text: str):
+        chunk_id = len(self._lengths)
+        counts = Counter(tokenize(text))
+        self._lengths.append(sum(counts.values()))
+        for term, freq in counts.items():
+            self._postings.setdefault(term, []).append((chunk_id, freq))
+
+    def build(self) -> "_DocumentPostings":
+        encoded = sorted((term.encode("utf-8"), term) for term in self._postings)
+        terms = [term for _, term in encoded]
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(raw) for raw, _ in encoded])
+        term_ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        chunk_ids = []
+        freqs = []
+        for i, term in enumerate(terms):
+            entries = self._postings[term]
+            term_ptr[i + 1] = term_ptr[i] + len(entries)
+            chunk_ids.extend(chunk_id for chunk_id, _ in entries)
+            freqs.extend(freq for _, freq in entries)
+        return _DocumentPostings(
+            term_bytes=np.frombuffer(b"".join(raw for raw, _ in encoded), dtype=np.uint8),
+            term_offsets=term_offsets,
+            term_ptr=term_ptr,
+            chunk_ids=np.array(chunk_ids, dtype=np.int32),
+            freqs=np.array(freqs, dtype=np.uint16 if not freqs or max(freqs) < 65536 else np.uint32),
+            chunk_lengths=np.array(self._lengths, dtype=np.int32)
+        )
+
+class _DocumentPostings:
+    """Índice invertido de un documento en formato CSR.
+
+    El vocabulario, ordenado por bytes, va concatenado en UTF-8 en `term_bytes`:
+    el término i es term_bytes[term_offsets[i]:term_offsets[i+1]]. Un array
+    np.str_ usaría 4 bytes por carácter del término más largo en cada término.
+    Las apariciones del término i están en chunk_ids[term_ptr[i]:term_ptr[i+1]]
+    con sus frecuencias en `freqs`.
+    """
+
+    def __init__(self, term_bytes: np.ndarray, term_offsets: np.ndarray, term_ptr: np.ndarray,
+                 chunk_ids: np.ndarray, freqs: np.ndarray, chunk_lengths: np.ndarray):
+        self.term_bytes = term_bytes
+        self.term_offsets = term_offsets
+        self.term_ptr = term_ptr
+        self.chunk_ids = chunk_ids
+        self.freqs = freqs
+        self.chunk_lengths = chunk_lengths
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "_DocumentPostings":
+        if "terms" in arrays:
+            # Índices guardados antes con el vocabulario como array np.str_
+            encoded = [str(term).encode("utf-8") for term in arrays["terms"]]
+            arrays = {name: value for name, value in arrays.items() if name != "terms"}
+            arrays["term_bytes"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            arrays["term_offsets"] = np.zeros(len(encoded) + 1, dtype=np.int64)
+            arrays["term_offsets"][1:] = np.cumsum([len(raw) for raw in encoded])
+        return cls(**arrays)
+
+    def _term(self, i: int) -> bytes:
+        return self.term_bytes[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    def lookup(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        target = term.encode("utf-8")
+        # Búsqueda binaria sobre el vocabulario ordenado por bytes
+        lo, hi = 0, self.term_offsets.shape[0] - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.term_offsets.shape[0] - 1 or self._term(lo) != target:
+            return None
+        i = lo
+        start, end = self.term_ptr[i], self.term_ptr[i + 1]
+        return self.chunk_ids[start:end], self.freqs[start:end]
+
+class BM25Index:
+    """Índice BM25 por contenido guardado junto a los fragmentos en blobs/{hash}/.
+
+    Se construye una vez por contenido al procesarlo (incremental: añadir o
+    borrar un documento no toca los demás; los duplicados lo comparten) y se consulta con NumPy acumulando
+    las contribuciones de cada término sobre un vector de scores.
+    """
+
+    _cache: "OrderedDict[str, Tuple[float, _DocumentPostings]]" = OrderedDict()
+    _max_cached = 512
+
+    def __init__(self, directory: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.directory = directory or settings.VECTOR_STORE_DIR
+        self.k1 = k1
+        self.b = b
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, "blobs", content_hash, "bm25.npz")
+
+    def save(self, content_hash: str, texts: Iterable[str]):
+        builder = BM25Builder()
+        for text in texts:
+            builder.add(text)
+        self.write(content_hash, builder)
+
+    def write(self, content_hash: str, builder: BM25Builder):
+        postings = builder.build()
+        path = self._path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(
+                f,
+                term_bytes=postings.term_bytes,
+                term_offsets=postings.term_offsets,
+                term_ptr=postings.term_ptr,
+                chunk_ids=postings.chunk_ids,
+                freqs=postings.freqs,
+                chunk_lengths=postings.chunk_lengths
+            )
+        os.replace(f"{path}.tmp", path)
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self._path(content_hash))
+
+    def delete(self, content_hash: str):
+        path = self._path(content_hash)
+        self._cache.pop(path, None)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _load(self, content_hash: str) -> _DocumentPostings:
+        path = self._path(content_hash)
+        mtime = os.path.getmtime(path)
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != mtime:
+            with np.load(path) as data:
+                postings = _DocumentPostings.from_arrays({name: data[name] for name in data.files})
+            cached = (mtime, postings)
+            self._cache[path] = cached
+            while len(self._cache) > self._max_cached:
+                self._cache.popitem(last=False)
+        self._cache.move_to_end(path)
+        return cached[1]
+
+    def search(self, content_hash: str, query: str, k: int) -> List[Tuple[int, float]]:
+        """Devuelve hasta k pares (ordinal del fragmento, score BM25)."""
+        if not self.exists(content_hash):
+            return []
+        postings = self._load(content_hash)
+        n_chunks = postings.chunk_lengths.shape[0]
+        if n_chunks == 0 or k <= 0:
+            return []
+        lengths = postings.chunk_lengths.astype(np.float32)
+        avgdl = max(float(lengths.mean()), 1.0)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+        scores = np.zeros(n_chunks, dtype=np.float32)
+        for term in set(tokenize(query)):
+            found = postings.lookup(term)
+            if found is None:
+                continue
+            chunk_ids, freqs = found
+            df = chunk_ids.shape[0]
+            idf = np.log(1 + (n_chunks - df + 0.5) / (df + 0.5))
+            tf = freqs.astype(np.float32)
+            # Un término aparece como mucho una vez por fragmento en sus postings
+            scores[chunk_ids] += idf * tf * (self.k1 + 1) / (tf + norm[chunk_ids])
+        matched = np.flatnonzero(scores)
+        if matched.shape[0] == 0:
+            return []
+        k = min(k, matched.shape[0])
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def search_all(self, documents: Dict[int, str], query: str, k: int) -> List[Tuple[int, int, float]]:
+        """Top-k BM25 sobre varios documentos (id -> hash): (document_id, ordinal, score).
+
+        Cada documento tiene sus propias estadísticas, así que los scores solo
+        son comparables de forma aproximada; basta para aportar candidatos a RRF.
+        """
+        results = []
+        for document_id, content_hash in documents.items():
+            results.extend(
+                (document_id, ordinal, score)
+                for ordinal, score in self.search(content_hash, query, k)
+            )
+        results.sort(key=lambda item: -item[2])
+        return results[:k]
+
+def reciprocal_rank_fusion(rankings: List[List[Hashable]], k: int = 60) -> List[Hashable]:
+    """Fusiona listas de identificadores ordenadas por relevancia (RRF)."""
+    fused = Counter()
+    for ranking in rankings:
+        for rank, ordinal in enumerate(ranking):
+            fused[ordinal] += 1.0 / (k + rank + 1)
+    return [ordinal for ordinal, _ in sorted(fused.items(), key=lambda item: (-item[1], item[0]))]
@@ -1,5 +1,38 @@
 # app/services/celery_config.py
+import asyncio
+from typing import Optional
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
 from app.core.config import settings
+from .llm_service import init_llm_service, close_llm_service
 
-celery_app = Celery('tasks', broker=f'redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0')
\ No newline at end of file
+celery_app = Celery(
+    'tasks',
+    broker=f'redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0',
+    # Necesario para los chords del resumen map-reduce
+    backend=f'redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}/0'
+)
+
+# Cada proceso worker mantiene su propio event loop: el cliente httpx del
+# LLMService compartido queda ligado a él y reutiliza sus conexiones entre tareas.
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def run_async(coro):
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop.run_until_complete(coro)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    async def _init():
+        init_llm_service()
+    run_async(_init())
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    global _worker_loop
+    if _worker_loop is not None:
+        _worker_loop.run_until_complete(close_llm_service())
+        _worker_loop.close()
+        _worker_loop = None
@@ -0,0 +1,125 @@
+# app/services/chunk_store.py
+from typing import Dict, Iterable, Iterator, List, Optional
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.document_chunk import DocumentChunk
+from app.models.document_page import DocumentPage
+from .context_builder import ContextChunk
+
+# Las páginas se separan en el contenido igual que en DocumentProcessor._process_pdf
+PAGE_SEPARATOR = "\n\n"
+
+def _to_chunk(row) -> ContextChunk:
+    return ContextChunk(
+        ordinal=row.ordinal,
+        start=row.start_offset,
+        end=row.end_offset,
+        text=row.text,
+        tokens=row.tokens
+    )
+
+def save_pages(db: Session, content_hash: str, pages: List[str]):
+    """Guarda las páginas de un PDF en una sola inserción múltiple (executemany).
+
+    Borra antes las que hubiera: una tarea reintentada no duplica filas. No
+    hace commit, para que el llamador lo agrupe con el resto de cambios.
+    """
+    rows = []
+    start = 0
+    for number, page in enumerate(pages, start=1):
+        end = start + len(page) + len(PAGE_SEPARATOR)
+        rows.append({
+            "content_hash": content_hash,
+            "number": number,
+            "start_offset": start,
+            "end_offset": end,
+            "text": page
+        })
+        start = end
+    db.execute(delete(DocumentPage).where(DocumentPage.content_hash == content_hash))
+    if rows:
+        db.execute(insert(DocumentPage), rows)
+
+def save_chunks(db: Session, content_hash: str, chunks: Iterable[ContextChunk], replace: bool = True):
+    """Guarda los fragmentos de un contenido en una sola inserción múltiple; no hace commit.
+
+    Con replace=False se añaden a los ya guardados, para insertar por lotes.
+    """
+    rows = [
+        {
+            "content_hash": content_hash,
+            "ordinal": chunk.ordinal,
+            "start_offset": chunk.start,
+            "end_offset": chunk.end,
+            "tokens": chunk.tokens,
+            "text": chunk.text
+        }
+        for chunk in chunks
+    ]
+    if replace:
+        db.execute(delete(DocumentChunk).where(DocumentChunk.content_hash == content_hash))
+    if rows:
+        db.execute(insert(DocumentChunk), rows)
+
+def has_pages(db: Session, content_hash: str) -> bool:
+    return db.execute(
+        select(DocumentPage.number).where(DocumentPage.content_hash == content_hash).limit(1)
+    ).first() is not None
+
+def iter_page_segments(db: Session, content_hash: str, batch_size: int = 100) -> Iterator[str]:
+    """Las páginas como segmentos del contenido, para el chunker, leídas por lotes.
+
+    Cada lote es una consulta aparte (por número de página), sin cursor
+    abierto entre lotes: el llamador puede hacer commit mientras la recorre.
+    """
+    last = 0
+    while True:
+        rows = db.execute(
+            select(DocumentPage.number, DocumentPage.text)
+            .where(DocumentPage.content_hash == content_hash, DocumentPage.number > last)
+            .order_by(DocumentPage.number)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        for number, text in rows:
+            yield text + PAGE_SEPARATOR
+        last = rows[-1].number
+
+async def count_chunks(db: AsyncSession, content_hash: str) -> int:
+    return (await db.execute(
+        select(func.count()).select_from(DocumentChunk).where(DocumentChunk.content_hash == content_hash)
+    )).scalar_one()
+
+async def load_chunks(db: AsyncSession, content_hash: str, ordinals: Iterable[int]) -> Dict[int, ContextChunk]:
+    """Solo los fragmentos pedidos, por ordinal."""
+    ordinals = list(ordinals)
+    if not ordinals:
+        return {}
+    result = await db.execute(
+        select(DocumentChunk).where(
+            DocumentChunk.content_hash == content_hash,
+            DocumentChunk.ordinal.in_(ordinals)
+        )
+    )
+    return {row.ordinal: _to_chunk(row) for row in result.scalars()}
+
+async def load_leading_chunks(db: AsyncSession, content_hash: str, limit: int) -> List[ContextChunk]:
+    """Los primeros `limit` fragmentos del contenido, en orden."""
+    result = await db.execute(
+        select(DocumentChunk)
+        .where(DocumentChunk.content_hash == content_hash)
+        .order_by(DocumentChunk.ordinal)
+        .limit(limit)
+    )
+    return [_to_chunk(row) for row in result.scalars()]
+
+async def page_of(db: AsyncSession, content_hash: str, offset: int) -> Optional[int]:
+    """Página (empezando en 1) que contiene el carácter `offset`, o None si no es un PDF."""
+    return (await db.execute(
+        select(DocumentPage.number)
+        .where(DocumentPage.content_hash == content_hash, DocumentPage.start_offset <= offset)
+        .order_by(DocumentPage.start_offset.desc())
+        .limit(1)
+    )).scalar()
@@ -0,0 +1,248 @@
+# app/services/context_builder.py
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+from app.core.config import settings
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Caracteres por token aproximados de cada familia de modelos (tokenizers BPE/SentencePiece)
+_CHARS_PER_TOKEN = {
+    "llama2": 3.5,
+    "llama3": 4.0,
+    "mistral": 3.5,
+    "gemma": 4.0,
+    "phi": 3.5,
+    "qwen": 3.5,
+}
+
+def chars_per_token(model: str) -> float:
+    family = model.split(":")[0].lower()
+    for prefix, ratio in _CHARS_PER_TOKEN.items():
+        if family.startswith(prefix):
+            return ratio
+    return 3.5
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Estima los tokens que ocupa `text` para el modelo configurado.
+
+    Cada palabra cuenta como al menos un token y las largas se parten según la
+    proporción de caracteres por token del modelo; la puntuación cuenta aparte.
+    Tiende a sobreestimar, que es lo seguro para no desbordar el contexto.
+    """
+    ratio = chars_per_token(model or settings.OLLAMA_MODEL)
+    return sum(max(1, math.ceil(len(piece) / ratio)) for piece in _TOKEN_RE.findall(text))
+
+def _terms(text: str) -> List[str]:
+    return [term for term in re.findall(r"\w+", text.lower()) if len(term) > 2]
+
+@dataclass
+class ContextChunk:
+    ordinal: int
+    start: int
+    end: int
+    text: str
+    tokens: int
+
+# Encabezados Markdown ("# Título") y HTML ("<h2>") empiezan sección
+_HEADING_RE = re.compile(r"^[ \t]*(?:#{1,6}[ \t]|<h[1-6][ >])", re.IGNORECASE)
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+_BLOCK_RE = re.compile(r"[^\n]+(?:\n(?![ \t]*\n)[^\n]*)*")
+_LINE_RE = re.compile(r"[^\n]+")
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?…]+(?=\s)|$)", re.DOTALL)
+
+class StreamingChunker:
+    """Parte texto en fragmentos de hasta chunk_tokens tokens respetando la estructura.
+
+    Consume el texto por segmentos (páginas, párrafos o bloques leídos del
+    fichero) y va devolviendo fragmentos con su posición en el texto completo,
+    sin necesitar nunca el documento entero en memoria: solo se guarda el
+    fragmento en curso y el párrafo que aún no ha terminado.
+
+    Los cortes caen, por orden de preferencia, en encabezados (que siempre
+    abren fragmento nuevo), párrafos, frases o filas de tabla, y solo en último
+    caso en un espacio. Cada fragmento repite hasta overlap_tokens tokens del
+    final del anterior para no perder contexto en la frontera.
+    """
+
+    def __init__(self, chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None, model: Optional[str] = None):
+        self.chunk_tokens = chunk_tokens or settings.LLM_CONTEXT_CHUNK_TOKENS
+        self.overlap_tokens = settings.CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+        self.model = model or settings.OLLAMA_MODEL
+        self.max_chars = int(self.chunk_tokens * chars_per_token(self.model))
+
+    def chunks(self, segments: Iterable[str]) -> Iterator[ContextChunk]:
+        buffer = ""
+        base = 0  # posición de buffer[0] en el texto completo
+        scanned = 0  # hasta dónde se ha troceado buffer en unidades
+        current: List[Tuple[int, int, int]] = []  # (inicio, fin, tokens) del fragmento en curso
+        ordinal = 0
+        for segment in segments:
+            buffer += segment
+            # Solo se trocea hasta el último salto de párrafo: lo que sigue puede continuar
+            # en el siguiente segmento. Un párrafo enorme se trocea igualmente para acotar memoria.
+            limit = None
+            for match in _PARAGRAPH_BREAK_RE.finditer(buffer, scanned):
+                limit = match.start()
+            if limit is None and len(buffer) - scanned > 4 * self.max_chars:
+                limit = buffer.rfind(" ", scanned, len(buffer) - self.max_chars)
+                limit = limit if limit > scanned else len(buffer) - self.max_chars
+            if limit is None:
+                continue
+            for chunk in self._pack(buffer, base, scanned, limit, current, ordinal):
+                ordinal += 1
+                yield chunk
+            scanned = limit
+            keep = min(current[0][0] - base, scanned) if current else scanned
+            buffer, base, scanned = buffer[keep:], base + keep, scanned - keep
+        for chunk in self._pack(buffer, base, scanned, len(buffer), current, ordinal):
+            ordinal += 1
+            yield chunk
+        if current:
+            yield self._make_chunk(buffer, base, current, ordinal)
+
+    def _pack(self, buffer: str, base: int, start: int, end: int, current: list, ordinal: int) -> Iterator[ContextChunk]:
+        for unit_start, unit_end, heading in self._units(buffer, start, end):
+            tokens = count_tokens(buffer[unit_start:unit_end], self.model)
+            used = sum(unit[2] for unit in current)
+            if current and (heading or used + tokens > self.chunk_tokens):
+                yield self._make_chunk(buffer, base, current, ordinal)
+                ordinal += 1
+                overlap = [] if heading else self._overlap(current, tokens)
+                current[:] = overlap
+            current.append((base + unit_start, base + unit_end, tokens))
+
+    def _overlap(self, units: List[Tuple[int, int, int]], next_tokens: int) -> List[Tuple[int, int, int]]:
+        tail: List[Tuple[int, int, int]] = []
+        used = 0
+        for unit in reversed(units[1:]):
+            if used + unit[2] > self.overlap_tokens or used + unit[2] + next_tokens > self.chunk_tokens:
+                break
+            tail.insert(0, unit)
+            used += unit[2]
+        return tail
+
+    def _units(self, buffer: str, start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+        """Unidades indivisibles (inicio, fin, es_encabezado) de buffer[start:end]."""
+        for block in _BLOCK_RE.finditer(buffer, start, end):
+            section_start = None
+            for line in _LINE_RE.finditer(buffer, block.start(), block.end()):
+                if _HEADING_RE.match(line.group()):
+                    if section_start is not None:
+                        yield from self._split_section(buffer, section_start, line.start() - 1)
+                    yield line.start(), line.end(), True
+                    section_start = None
+                elif section_start is None:
+                    section_start = line.start()
+            if section_start is not None:
+                yield from self._split_section(buffer, section_start, block.end())
+
+    def _split_section(self, buffer: str, start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+        if end - start <= self.max_chars:
+            yield start, end, False
+            return
+        lines = list(_LINE_RE.finditer(buffer, start, end))
+        # Tablas: una fila por unidad para no partir nunca una fila
+        if sum(line.group().lstrip().startswith("|") or "\t" in line.group() for line in lines) > len(lines) / 2:
+            pieces = ((line.start(), line.end()) for line in lines)
+        else:
+            pieces = ((match.start(), match.end()) for match in _SENTENCE_RE.finditer(buffer, start, end))
+        for piece_start, piece_end in pieces:
+            yield from self._hard_split(buffer, piece_start, piece_end)
+
+    def _hard_split(self, buffer: str, start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+        # Frases sin puntuación más largas que un fragmento: se cortan en un espacio
+        while end - start > self.max_chars:
+            cut = buffer.rfind(" ", start + self.max_chars // 2, start + self.max_chars)
+            cut = cut if cut > start else start + self.max_chars
+            yield start, cut, False
+            start = cut
+            while start < end and buffer[start].isspace():
+                start += 1
+        if start < end:
+            yield start, end, False
+
+    def _make_chunk(self, buffer: str, base: int, units: List[Tuple[int, int, int]], ordinal: int) -> ContextChunk:
+        start, end = units[0][0], units[-1][1]
+        text = buffer[start - base:end - base]
+        return ContextChunk(
+            ordinal=ordinal,
+            start=start,
+            end=end,
+            text=text,
+            # Los separadores entre unidades son espacios, que no cuentan como tokens
+            tokens=sum(unit[2] for unit in units)
+        )
+
+@dataclass
+class BuiltContext:
+    text: str
+    tokens: int
+    chunks: List[ContextChunk]
+    total_chunks: int
+
+    def report(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "chunks": len(self.chunks),
+            "total_chunks": self.total_chunks
+        }
+
+class ContextBuilder:
+    """Arma el contexto de una pregunta sin pasarse de un presupuesto de tokens.
+
+    Parte el documento en fragmentos por párrafos, los puntúa por coincidencia
+    de términos con la pregunta y mete los mejores hasta llenar el presupuesto,
+    devolviéndolos en el orden en que aparecen en el documento.
+    """
+
+    def __init__(self, budget: Optional[int] = None, chunk_tokens: Optional[int] = None, model: Optional[str] = None):
+        self.budget = budget or settings.LLM_CONTEXT_BUDGET
+        self.chunk_tokens = chunk_tokens or settings.LLM_CONTEXT_CHUNK_TOKENS
+        self.model = model or settings.OLLAMA_MODEL
+
+    def split(self, content: str) -> List[ContextChunk]:
+        return list(StreamingChunker(self.chunk_tokens, overlap_tokens=0, model=self.model).chunks([content]))
+
+    def build(self, content: str, question: str) -> BuiltContext:
+        chunks = self.split(content or "")
+        if sum(chunk.tokens for chunk in chunks) <= self.budget:
+            return self._assemble(chunks, len(chunks))
+
+        question_terms = set(_terms(question))
+        chunk_terms = [Counter(_terms(chunk.text)) for chunk in chunks]
+        # Idf simple para que las palabras comunes pesen menos que las específicas
+        document_frequency = Counter(term for terms in chunk_terms for term in set(terms) & question_terms)
+        scores = []
+        for chunk, terms in zip(chunks, chunk_terms):
+            score = sum(
+                (1 + math.log(terms[term])) * math.log(1 + len(chunks) / document_frequency[term])
+                for term in question_terms if terms[term]
+            )
+            scores.append(score)
+
+        ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+        return self.select([chunks[i] for i in ranked], len(chunks))
+
+    def select(self, ranked: List[ContextChunk], total_chunks: int) -> BuiltContext:
+        """Toma fragmentos ya ordenados por relevancia hasta llenar el presupuesto."""
+        selected: List[ContextChunk] = []
+        used = 0
+        for chunk in ranked:
+            if used + chunk.tokens > self.budget:
+                continue
+            selected.append(chunk)
+            used += chunk.tokens
+        selected.sort(key=lambda chunk: chunk.ordinal)
+        return self._assemble(selected, total_chunks)
+
+    @staticmethod
+    def _assemble(chunks: List[ContextChunk], total_chunks: int) -> BuiltContext:
+        return BuiltContext(
+            text="\n\n".join(chunk.text for chunk in chunks),
+            tokens=sum(chunk.tokens for chunk in chunks),
+            chunks=chunks,
+            total_chunks=total_chunks
+        )
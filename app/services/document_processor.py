@@ -1,70 +1,477 @@
 # app/services/document_processor.py
-from .celery_config import celery_app
+from .celery_config import celery_app, run_async
+import codecs
+import hashlib
 import os
-from typing import Optional, Tuple
-from fastapi import UploadFile
+import uuid
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+from celery import chord
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded, WorkerLostError
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import numpy as np
 import PyPDF2
 import docx
 import markdown
-from .llm_service import LLMService
+try:
+    import resource
+except ImportError:  # pragma: no cover - no disponible en Windows
+    resource = None
+from .summarization import SummaryGrouper, start_summary_pipeline, update_blob
+from .context_builder import StreamingChunker
+from .vector_store import VectorStore
+from .bm25_index import BM25Builder, BM25Index
+from .retrieval import embed_chunks
+from .llm_service import init_llm_service
+from .progress import ProgressTracker
+from .chunk_store import PAGE_SEPARATOR, has_pages, iter_page_segments, save_chunks, save_pages
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+
+# Firma esperada al principio del fichero para cada extensión admitida
+_MAGIC = {
+    ".pdf": b"%PDF-",
+    ".docx": b"PK\x03\x04",
+    ".md": None,
+    ".txt": None,
+}
+
+def sniff_upload(extension: str, head: bytes):
+    """Comprueba con los primeros bytes que el contenido corresponde a la extensión."""
+    if extension not in _MAGIC:
+        raise HTTPException(status_code=415, detail=f"Tipo de archivo no soportado: {extension or 'sin extensión'}")
+    magic = _MAGIC[extension]
+    if magic is not None:
+        valid = head.startswith(magic)
+    else:
+        # Texto: sin bytes nulos y UTF-8 válido (el decodificador incremental
+        # admite un carácter multibyte cortado al final del bloque)
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(head)
+            valid = b"\x00" not in head
+        except UnicodeDecodeError:
+            valid = False
+    if not valid:
+        raise HTTPException(status_code=415, detail=f"El contenido no corresponde a un archivo {extension}")
+
+def _write_block(buffer, digest, block: bytes):
+    digest.update(block)
+    buffer.write(block)
 
 class DocumentProcessor:
     @staticmethod
-    async def process_document(file: UploadFile) -> Tuple[str, str, Optional[str]]:
-        content = ""
-        file_path = f"uploads/{file.filename}"
-        os.makedirs("uploads", exist_ok=True)
-        
-        with open(file_path, "wb") as buffer:
-            content_bytes = await file.read()
-            buffer.write(content_bytes)
-        
-        if file.filename.endswith('.pdf'):
-            content = DocumentProcessor._process_pdf(file_path)
-        elif file.filename.endswith('.docx'):
-            content = DocumentProcessor._process_docx(file_path)
-        elif file.filename.endswith('.md'):
-            content = DocumentProcessor._process_markdown(file_path)
-        elif file.filename.endswith('.txt'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        
-        # Generate summary using LLM
+    async def save_upload(file: UploadFile) -> Tuple[str, str, str]:
+        """Guarda el fichero por bloques calculando su SHA-256 mientras llega.
+
+        La memoria queda acotada a un bloque (UPLOAD_CHUNK_SIZE) por subida, el
+        tipo se comprueba con el primer bloque y la subida se corta en cuanto
+        supera UPLOAD_MAX_SIZE. Se escribe en una ruta temporal única, así que
+        subidas simultáneas con el mismo nombre no se pisan. Devuelve (hash,
+        ruta temporal, ruta final uploads/{sha256}{extensión}); el fichero se
+        mueve a la ruta final en register_upload, con el blob bloqueado.
+        """
+        upload_dir = settings.UPLOAD_DIR
+        os.makedirs(upload_dir, exist_ok=True)
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+        size = 0
         try:
-            llm_service = LLMService()
-            # Use the first 1000 characters to generate a summary
-            text_to_summarize = content[:1000]
-            summary = await llm_service.generate_summary(text_to_summarize)
-        except Exception as e:
-            print(f"Error generating summary: {str(e)}")
-            summary = "No summary available"
-                
-        process_document_task.delay(file_path, content)
-        return content, file_path, summary
+            with open(tmp_path, "wb") as buffer:
+                while True:
+                    block = await file.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not block:
+                        break
+                    if size == 0:
+                        sniff_upload(extension, block)
+                    size += len(block)
+                    if size > settings.UPLOAD_MAX_SIZE:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"El archivo supera el tamaño máximo de {settings.UPLOAD_MAX_SIZE} bytes"
+                        )
+                    # Hash y escritura fuera del event loop
+                    await run_in_threadpool(_write_block, buffer, digest, block)
+            if size == 0:
+                raise HTTPException(status_code=400, detail="El archivo está vacío")
+            content_hash = digest.hexdigest()
+            file_path = os.path.join(upload_dir, f"{content_hash}{extension}")
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash, tmp_path, file_path
 
     @staticmethod
-    def _process_pdf(file_path: str) -> str:
-        text = ""
+    def place_upload(tmp_path: str, file_path: str):
+        """Mueve la subida temporal a su ruta final, o la descarta si ese fichero ya existe.
+
+        Las subidas del mismo contenido comparten fichero.
+        """
+        if os.path.exists(file_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, file_path)
+
+    @staticmethod
+    def extract_text(file_path: str) -> str:
+        return "".join(DocumentProcessor.iter_text(file_path))
+
+    @staticmethod
+    def iter_text(file_path: str) -> Iterator[str]:
+        """Texto del fichero por segmentos (páginas, párrafos o bloques).
+
+        Concatenar los segmentos da exactamente el contenido que se guarda en
+        DocumentBlob.content, así que las posiciones de los fragmentos coinciden.
+        """
+        if file_path.endswith('.pdf'):
+            return DocumentProcessor._process_pdf(file_path)
+        elif file_path.endswith('.docx'):
+            return DocumentProcessor._process_docx(file_path)
+        elif file_path.endswith('.md'):
+            return DocumentProcessor._process_markdown(file_path)
+        elif file_path.endswith('.txt'):
+            return DocumentProcessor._process_txt(file_path)
+        return iter(())
+
+    @staticmethod
+    def _process_pdf(file_path: str) -> Iterator[str]:
         with open(file_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
             for page in pdf_reader.pages:
-                text += page.extract_text()
-        return text
+                # Cada página es un párrafo aparte para no pegar la última y la primera palabra
+                yield page.extract_text() + PAGE_SEPARATOR
 
     @staticmethod
-    def _process_docx(file_path: str) -> str:
+    def count_pdf_pages(file_path: str) -> int:
+        with open(file_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+
+    @staticmethod
+    def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+        """Texto de las páginas [start, stop) (empezando en 0), para repartir un PDF entre procesos."""
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            return [pdf_reader.pages[i].extract_text() for i in range(start, min(stop, len(pdf_reader.pages)))]
+
+    @staticmethod
+    def _process_docx(file_path: str) -> Iterator[str]:
         doc = docx.Document(file_path)
-        return " ".join([paragraph.text for paragraph in doc.paragraphs])
+        for paragraph in doc.paragraphs:
+            yield paragraph.text + "\n\n"
+
+    @staticmethod
+    def _process_markdown(file_path: str) -> Iterator[str]:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            yield markdown.markdown(file.read())
 
     @staticmethod
-    def _process_markdown(file_path: str) -> str:
+    def _process_txt(file_path: str, block_size: int = 65536) -> Iterator[str]:
         with open(file_path, 'r', encoding='utf-8') as file:
-            return markdown.markdown(file.read())
+            yield from iter(lambda: file.read(block_size), "")
+
+async def register_upload(
+    db: AsyncSession,
+    title: str,
+    owner_id: int,
+    content_hash: str,
+    tmp_path: str,
+    file_path: str
+) -> Tuple[Document, bool]:
+    """Crea el Document apuntando al contenido, reutilizándolo si ya existía.
+
+    Un contenido nuevo se registra en estado "processing" sin texto: lo
+    extrae el pipeline de Celery. Uno que falló (p. ej. Ollama caído durante
+    el resumen) vuelve a "processing" para procesarse otra vez. Devuelve
+    (documento, True si hay que lanzar el procesamiento).
+
+    El fichero subido (`tmp_path`) se mueve a su sitio con la fila del blob
+    ya bloqueada: si release_document acaba de borrar el fichero compartido,
+    aquí se vuelve a colocar antes de que nadie lo necesite.
+    """
+    try:
+        for attempt in range(2):
+            # Bloquea la fila para no cruzarse con el borrado de la última referencia
+            blob = (await db.execute(
+                select(DocumentBlob).where(DocumentBlob.sha256 == content_hash).with_for_update()
+            )).scalars().first()
+            needs_processing = blob is None or blob.status == "failed"
+            if blob is None:
+                blob = DocumentBlob(sha256=content_hash, file_path=file_path, status="processing", ref_count=0)
+                db.add(blob)
+            elif needs_processing:
+                blob.status = "processing"
+                blob.error = None
+            await run_in_threadpool(DocumentProcessor.place_upload, tmp_path, blob.file_path)
+            blob.ref_count += 1
+            document = Document(title=title, file_path=blob.file_path, owner_id=owner_id, blob=blob)
+            db.add(document)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Otra subida del mismo contenido creó el blob a la vez: se reutiliza
+                await db.rollback()
+                if attempt:
+                    raise
+                continue
+            return document, needs_processing
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def attach_document(document_id: int, owner_id: int, content_hash: str) -> bool:
+    """Copia los embeddings del contenido al índice del usuario, si ya existen."""
+    store = VectorStore()
+    vectors = store.load_embeddings(content_hash)
+    if vectors is None or not len(vectors):
+        return False
+    store.save(owner_id, document_id, vectors)
+    return True
+
+async def release_document(db: AsyncSession, document: Document) -> bool:
+    """Borra el documento y, si era la última referencia, su contenido compartido.
+
+    Devuelve True si se eliminó el contenido.
+    """
+    content_hash = document.content_hash
+    await db.delete(document)
+    blob = (await db.execute(
+        select(DocumentBlob).where(DocumentBlob.sha256 == content_hash).with_for_update()
+    )).scalars().first()
+    if blob is None:
+        await db.commit()
+        return False
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        await db.commit()
+        return False
+    file_path = blob.file_path
+    await db.delete(blob)
+    await db.flush()
+    # Se borra antes del commit, con la fila bloqueada: una subida simultánea
+    # del mismo contenido espera al bloqueo en register_upload y solo entonces
+    # mueve su fichero temporal a la ruta compartida
+    await run_in_threadpool(_delete_blob_files, content_hash, file_path)
+    await db.commit()
+    return True
+
+def _delete_blob_files(content_hash: str, file_path: Optional[str]):
+    if file_path and os.path.exists(file_path):
+        os.remove(file_path)
+    VectorStore().delete_blob(content_hash)
+    BM25Index().delete(content_hash)
+    ProgressTracker().clear(content_hash)
+
+@contextmanager
+def _memory_limit(memory_limit_mb: int):
+    """Tope de memoria virtual adicional mientras dura una extracción.
+
+    Solo se baja el límite blando y se restaura al terminar, así que el worker
+    sigue sirviendo otras tareas; un PDF hostil acaba en MemoryError.
+    """
+    if resource is None or memory_limit_mb <= 0 or not os.path.exists("/proc/self/statm"):
+        yield
+        return
+    with open("/proc/self/statm") as f:
+        in_use = int(f.read().split()[0]) * resource.getpagesize()
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = in_use + memory_limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _fail(content_hash: str, error: Exception):
+    if isinstance(error, (SoftTimeLimitExceeded, TimeLimitExceeded)):
+        detail = "La extracción superó el límite de tiempo"
+    elif isinstance(error, WorkerLostError):
+        detail = "El worker murió durante la extracción (posible límite de memoria)"
+    else:
+        detail = str(error)
+    print(f"Error processing content {content_hash}: {detail}")
+    update_blob(content_hash, status="failed", error=detail)
+    ProgressTracker().update(content_hash, status="failed", stage="failed", error=detail)
+
+# Extracción: sin reintentos (un fichero que falla vuelve a fallar) y sin
+# reencolar si el worker muere por el límite duro de tiempo o memoria
+EXTRACTION_TASK_OPTIONS = dict(
+    acks_late=True,
+    soft_time_limit=settings.EXTRACTION_TIMEOUT,
+    time_limit=settings.EXTRACTION_TIMEOUT + 30
+)
 
 @celery_app.task
-def process_document_task(file_path: str, content: str):
+def extraction_failed_task(request, exc, traceback, content_hash: str):
+    """Errback de la extracción y de su chord.
+
+    Cubre lo que no llega a un except: el límite duro de tiempo, un worker
+    muerto (WorkerLostError) o un rango de páginas que falla y deja el
+    cuerpo del chord sin ejecutar.
+    """
+    _fail(content_hash, exc)
+
+@celery_app.task(**EXTRACTION_TASK_OPTIONS)
+def process_document_task(content_hash: str, user_id: Optional[int] = None):
+    """Pipeline de ingesta: extracción, troceado, embeddings y resumen.
+
+    Los PDF se reparten por rangos de páginas entre los workers con un chord;
+    el resto de formatos se extraen aquí mismo.
+    """
+    tracker = ProgressTracker()
+    db = SessionLocal()
     try:
-        chunks = [content[i:i+1000] for i in range(0, len(content), 1000)]
-        print(f"Processing document: {file_path}, chunks: {len(chunks)}")
+        file_path = db.query(DocumentBlob.file_path).filter(DocumentBlob.sha256 == content_hash).scalar()
+    finally:
+        db.close()
+    if file_path is None:
+        print(f"Content {content_hash} not found")
+        return
+
+    try:
+        tracker.update(content_hash, status="processing", stage="extracting")
+        if file_path.endswith(".pdf"):
+            with _memory_limit(settings.EXTRACTION_MEMORY_LIMIT_MB):
+                total = DocumentProcessor.count_pdf_pages(file_path)
+            size = max(1, settings.EXTRACTION_PDF_PAGES_PER_JOB)
+            tracker.update(content_hash, pages_total=total, pages_done=0)
+            if total == 0:
+                store_pages_task.run([], content_hash, user_id)
+                return
+            chord(
+                extract_pages_task.s(content_hash, file_path, start, start + size)
+                for start in range(0, total, size)
+            )(store_pages_task.s(content_hash, user_id).on_error(extraction_failed_task.s(content_hash)))
+            return
+        with _memory_limit(settings.EXTRACTION_MEMORY_LIMIT_MB):
+            content = DocumentProcessor.extract_text(file_path)
+        update_blob(content_hash, content=content)
     except Exception as e:
-        print(f"Error processing document: {str(e)}")
\ No newline at end of file
+        _fail(content_hash, e)
+        return
+    # Fuera de esta tarea: los embeddings no cuentan para el plazo de extracción
+    index_content_task.delay(content_hash, file_path, user_id)
+
+@celery_app.task(**EXTRACTION_TASK_OPTIONS)
+def extract_pages_task(content_hash: str, file_path: str, start: int, stop: int) -> List[str]:
+    try:
+        with _memory_limit(settings.EXTRACTION_MEMORY_LIMIT_MB):
+            pages = DocumentProcessor.extract_pdf_pages(file_path, start, stop)
+    except Exception as e:
+        _fail(content_hash, e)
+        raise
+    ProgressTracker().increment(content_hash, "pages_done", len(pages))
+    return pages
+
+@celery_app.task(acks_late=True)
+def store_pages_task(ranges: List[List[str]], content_hash: str, user_id: Optional[int] = None):
+    pages = [page for pages in ranges for page in pages]
+    db = SessionLocal()
+    try:
+        # Páginas y contenido en la misma transacción
+        save_pages(db, content_hash, pages)
+        blob = db.query(DocumentBlob).filter(DocumentBlob.sha256 == content_hash).first()
+        if blob is not None:
+            blob.content = "".join(page + PAGE_SEPARATOR for page in pages)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        _fail(content_hash, e)
+        return
+    finally:
+        db.close()
+    index_content_task.delay(content_hash, None, user_id)
+
+@celery_app.task(acks_late=True)
+def index_content_task(content_hash: str, file_path: Optional[str], user_id: Optional[int] = None):
+    """Trocea, indexa y genera embeddings del contenido ya extraído; después lanza el resumen.
+
+    Los fragmentos se consumen por lotes según salen del chunker: cada lote se
+    inserta, se añade al índice BM25, se pasa a embeddings y se agrupa para el
+    resumen, así que nunca están todos en memoria a la vez.
+    """
+    tracker = ProgressTracker()
+    bm25 = BM25Builder()
+    grouper = SummaryGrouper()
+    vectors = []
+    embedding_error = None
+    count = 0
+    db = SessionLocal()
+    try:
+        if has_pages(db, content_hash):
+            # Las páginas ya extraídas evitan volver a parsear el PDF
+            segments = iter_page_segments(db, content_hash)
+        elif file_path and os.path.exists(file_path):
+            # El contenido completo no se carga: se vuelve a leer del fichero por segmentos
+            segments = DocumentProcessor.iter_text(file_path)
+        else:
+            segments = [db.query(DocumentBlob.content).filter(DocumentBlob.sha256 == content_hash).scalar() or ""]
+
+        # Index every chunk so /ask can retrieve the top-k instead of sending the whole text
+        tracker.update(content_hash, stage="indexing", chunks=0)
+        for batch in _batched(StreamingChunker().chunks(segments), settings.INDEX_BATCH_SIZE):
+            # El primer lote borra los fragmentos de un intento anterior
+            save_chunks(db, content_hash, batch, replace=count == 0)
+            db.commit()
+            for chunk in batch:
+                bm25.add(chunk.text)
+                grouper.add(chunk)
+            if embedding_error is None:
+                try:
+                    vectors.append(
+                        VectorStore.normalize(embed_chunks(batch, init_llm_service(), run_async)).astype(np.float16)
+                    )
+                except Exception as e:
+                    # Sin embeddings la búsqueda sigue funcionando con BM25
+                    embedding_error = e
+                    print(f"Error embedding content {content_hash}: {str(e)}")
+            count += len(batch)
+            tracker.update(content_hash, chunks=count)
+        print(f"Processing content: {content_hash}, chunks: {count}")
+        BM25Index().write(content_hash, bm25)
+    except Exception as e:
+        db.rollback()
+        _fail(content_hash, e)
+        return
+    finally:
+        db.close()
+
+    if vectors and embedding_error is None:
+        tracker.update(content_hash, stage="embedding")
+        try:
+            VectorStore().save_embeddings(content_hash, np.concatenate(vectors))
+            # Los documentos que apuntan a este contenido, incluidos los subidos
+            # mientras se procesaba, reciben sus filas en el índice de su dueño
+            db = SessionLocal()
+            try:
+                documents = db.query(Document.id, Document.owner_id).filter(
+                    Document.content_hash == content_hash
+                ).all()
+            finally:
+                db.close()
+            for document_id, owner_id in documents:
+                attach_document(document_id, owner_id, content_hash)
+        except Exception as e:
+            print(f"Error embedding content {content_hash}: {str(e)}")
+
+    # Summarize the whole document: chunk summaries in parallel, then reduce
+    tracker.update(content_hash, stage="summarizing")
+    start_summary_pipeline(content_hash, grouper.finish(), user_id=user_id)
\ No newline at end of file
@@ -0,0 +1,144 @@
+# app/services/llm_cache.py
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+class LLMCache:
+    """Caché de respuestas del LLM en dos niveles.
+
+    El primer nivel es un LRU en memoria del proceso con límite de tamaño y TTL;
+    el segundo es Redis, compartido por todos los workers de la API y de Celery.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: int = 3600,
+        redis_client: Optional[aioredis.Redis] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis = redis_client
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._document_keys: Dict[int, Set[str]] = {}
+        self._key_documents: Dict[str, int] = {}
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls) -> "LLMCache":
+        redis_client = None
+        if settings.LLM_CACHE_REDIS_ENABLED:
+            redis_client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.LLM_CACHE_REDIS_DB
+            )
+        return cls(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl=settings.LLM_CACHE_TTL,
+            redis_client=redis_client
+        )
+
+    @staticmethod
+    def make_key(model: str, template_version: str, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"llm:{model}:{template_version}:{digest}"
+
+    @staticmethod
+    def _document_set(document_id: int) -> str:
+        return f"llm:doc:{document_id}"
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop_local(key)
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(key)
+            except Exception as e:
+                print(f"Error leyendo caché en Redis: {str(e)}")
+                value = None
+            if value is not None:
+                value = value.decode("utf-8")
+                self._store_local(key, value)
+                self.redis_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, document_id: Optional[int] = None):
+        self._store_local(key, value)
+        if document_id is not None:
+            self._document_keys.setdefault(document_id, set()).add(key)
+            self._key_documents[key] = document_id
+
+        if self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(key, value, ex=self.ttl)
+                    if document_id is not None:
+                        doc_set = self._document_set(document_id)
+                        pipe.sadd(doc_set, key)
+                        pipe.expire(doc_set, self.ttl)
+                    await pipe.execute()
+            except Exception as e:
+                print(f"Error escribiendo caché en Redis: {str(e)}")
+
+    async def invalidate_document(self, document_id: int):
+        for key in self._document_keys.pop(document_id, set()):
+            self._entries.pop(key, None)
+            self._key_documents.pop(key, None)
+
+        if self.redis is not None:
+            try:
+                doc_set = self._document_set(document_id)
+                keys = await self.redis.smembers(doc_set)
+                if keys:
+                    await self.redis.delete(*keys)
+                await self.redis.delete(doc_set)
+            except Exception as e:
+                print(f"Error invalidando caché en Redis: {str(e)}")
+
+    def _store_local(self, key: str, value: str):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._drop_local(next(iter(self._entries)))
+
+    def _drop_local(self, key: str):
+        # Al expirar o salir del LRU la clave deja también el índice por documento,
+        # que si no crecería sin límite en un worker de larga duración
+        self._entries.pop(key, None)
+        document_id = self._key_documents.pop(key, None)
+        if document_id is not None:
+            keys = self._document_keys.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._document_keys[document_id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.redis_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.redis_hits) / lookups if lookups else 0.0
+        }
+
+    async def aclose(self):
+        if self.redis is not None:
+            await self.redis.aclose()
@@ -1,24 +1,48 @@
 # app/services/llm_service.py
-from langchain_community.llms import Ollama
-from typing import List
+from typing import AsyncIterator, List, Optional
 import json
 from fastapi import HTTPException
 from app.core.config import settings
+from .ollama_client import OllamaClient
+from .llm_cache import LLMCache
+from .semantic_cache import SemanticCache
+from .single_flight import SingleFlight
+from .admission import AdmissionController, OverloadedError, INTERACTIVE, BACKGROUND
 import os
 
+# Incrementar cuando cambie el texto de algún prompt para no servir respuestas viejas de la caché
+PROMPT_TEMPLATE_VERSION = "1"
+
 class LLMService:
-    def __init__(self):
-        try:
-            base_url = os.environ.get("OLLAMA_BASE_URL", settings.OLLAMA_BASE_URL)
-            model = os.environ.get("OLLAMA_MODEL", settings.OLLAMA_MODEL)
-            
-            print(f"Conectando a Ollama en: {base_url} con modelo: {model}")
-            
-            self.llm = Ollama(
-                base_url=base_url,
-                model=model
-            )
-            
+    def __init__(
+        self,
+        client: Optional[OllamaClient] = None,
+        cache: Optional[LLMCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        flights: Optional[SingleFlight] = None,
+        admission: Optional[AdmissionController] = None
+    ):
+        try:
+            if client is None:
+                base_url = os.environ.get("OLLAMA_BASE_URL", settings.OLLAMA_BASE_URL)
+                model = os.environ.get("OLLAMA_MODEL", settings.OLLAMA_MODEL)
+
+                print(f"Conectando a Ollama en: {base_url} con modelo: {model}")
+
+                client = OllamaClient(base_url=base_url, model=model)
+            self.llm = client
+            if cache is None and settings.LLM_CACHE_ENABLED:
+                cache = LLMCache.from_settings()
+            self.cache = cache
+            if semantic_cache is None and settings.SEMANTIC_CACHE_ENABLED:
+                semantic_cache = SemanticCache(
+                    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                    max_per_document=settings.SEMANTIC_CACHE_MAX_PER_DOCUMENT
+                )
+            self.semantic_cache = semantic_cache
+            self.flights = flights or SingleFlight.from_settings()
+            self.admission = admission or AdmissionController.from_settings()
+
         except Exception as e:
             print(f"Error de inicialización de Ollama: {str(e)}")
             raise HTTPException(
@@ -26,10 +50,26 @@ class LLMService:
                 detail=f"No se pudo conectar al servicio LLM. Asegúrate de que Ollama esté corriendo. Error: {str(e)}"
             )
 
-    async def generate_summary(self, content: str) -> str:
+    @staticmethod
+    def _overloaded(e: OverloadedError) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    def ensure_capacity(self):
+        try:
+            self.admission.check_capacity()
+        except OverloadedError as e:
+            raise self._overloaded(e)
+
+    async def generate_summary(self, content: str, user_id: Optional[int] = None) -> str:
         try:
             prompt = f"Genera un resumen del siguiente texto:\n{content}"
-            return self.llm.invoke(prompt)
+            return await self._generate(prompt, user_id=user_id, priority=BACKGROUND)
+        except OverloadedError as e:
+            raise self._overloaded(e)
         except Exception as e:
             print(f"Error generando resumen: {str(e)}")
             raise HTTPException(
@@ -37,10 +77,87 @@ class LLMService:
                 detail=f"Error al generar el resumen: {str(e)}"
             )
 
-    async def answer_question(self, context: str, question: str) -> str:
+    async def combine_summaries(self, summaries: List[str], user_id: Optional[int] = None) -> str:
+        try:
+            joined = "\n\n".join(f"- {summary}" for summary in summaries)
+            prompt = f"Combina los siguientes resúmenes parciales de un mismo documento en un único resumen coherente:\n{joined}"
+            return await self._generate(prompt, user_id=user_id, priority=BACKGROUND)
+        except OverloadedError as e:
+            raise self._overloaded(e)
+        except Exception as e:
+            print(f"Error combinando resúmenes: {str(e)}")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Error al combinar los resúmenes: {str(e)}"
+            )
+
+    @staticmethod
+    def _question_prompt(context: str, question: str) -> str:
+        return f"Basándote en el siguiente contexto:\n{context}\n\nResponde esta pregunta:\n{question}"
+
+    def _cache_key(self, prompt: str) -> str:
+        return LLMCache.make_key(self.llm.model, PROMPT_TEMPLATE_VERSION, prompt)
+
+    async def _generate(
+        self,
+        prompt: str,
+        document_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        priority: str = INTERACTIVE
+    ) -> str:
+        key = self._cache_key(prompt)
+
+        async def load() -> str:
+            if self.cache is not None:
+                cached = await self.cache.get(key)
+                if cached is not None:
+                    return cached
+            async with self.admission.slot(user_id, priority):
+                result = await self.llm.generate(prompt)
+            if self.cache is not None:
+                await self.cache.set(key, result, document_id=document_id)
+            return result
+
+        # Las peticiones idénticas en curso comparten una sola generación
+        return await self.flights.do(key, load)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        return await self.llm.embed(texts)
+
+    async def _embed_question(self, question: str, document_id: Optional[int], question_vector=None):
+        if self.semantic_cache is None or document_id is None:
+            return None
+        if question_vector is not None:
+            return question_vector
+        try:
+            embeddings = await self.llm.embed([question])
+            return embeddings[0] if embeddings else None
+        except Exception as e:
+            # La caché semántica es opcional: si falla el embedding se responde normalmente
+            print(f"Error generando embedding de la pregunta: {str(e)}")
+            return None
+
+    async def answer_question(
+        self,
+        context: str,
+        question: str,
+        document_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        question_vector: Optional[List[float]] = None
+    ) -> str:
         try:
-            prompt = f"Basándote en el siguiente contexto:\n{context}\n\nResponde esta pregunta:\n{question}"
-            return self.llm.invoke(prompt)
+            vector = await self._embed_question(question, document_id, question_vector)
+            if vector is not None:
+                cached = self.semantic_cache.lookup(document_id, vector)
+                if cached is not None:
+                    return cached
+            prompt = self._question_prompt(context, question)
+            answer = await self._generate(prompt, document_id=document_id, user_id=user_id)
+            if vector is not None:
+                self.semantic_cache.add(document_id, vector, answer)
+            return answer
+        except OverloadedError as e:
+            raise self._overloaded(e)
         except Exception as e:
             print(f"Error respondiendo pregunta: {str(e)}")
             raise HTTPException(
@@ -48,6 +165,79 @@ class LLMService:
                 detail=f"Error al responder la pregunta: {str(e)}"
             )
 
+    async def _admitted_stream(self, prompt: str, user_id: Optional[int] = None) -> AsyncIterator[str]:
+        async with self.admission.slot(user_id, INTERACTIVE):
+            async for token in self.llm.stream(prompt):
+                yield token
+
+    async def stream_answer(
+        self,
+        context: str,
+        question: str,
+        document_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        question_vector: Optional[List[float]] = None
+    ) -> AsyncIterator[str]:
+        vector = await self._embed_question(question, document_id, question_vector)
+        if vector is not None:
+            cached = self.semantic_cache.lookup(document_id, vector)
+            if cached is not None:
+                yield cached
+                return
+        prompt = self._question_prompt(context, question)
+        tokens = []
+        stream = self._stream_prompt(prompt, document_id=document_id, user_id=user_id)
+        try:
+            async for token in stream:
+                tokens.append(token)
+                yield token
+        finally:
+            await stream.aclose()
+        if vector is not None:
+            self.semantic_cache.add(document_id, vector, "".join(tokens))
+
+    async def stream_library_answer(
+        self,
+        context: str,
+        question: str,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        prompt = (
+            "Responde la pregunta usando solo los fragmentos numerados de la biblioteca del usuario. "
+            "Cita cada afirmación con el número del fragmento entre corchetes, por ejemplo [2].\n\n"
+            f"Fragmentos:\n{context}\n\nPregunta:\n{question}"
+        )
+        stream = self._stream_prompt(prompt, user_id=user_id)
+        try:
+            async for token in stream:
+                yield token
+        finally:
+            await stream.aclose()
+
+    async def _stream_prompt(
+        self,
+        prompt: str,
+        document_id: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        key = self._cache_key(prompt)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        tokens = []
+        flight = self.flights.stream(key, lambda: self._admitted_stream(prompt, user_id))
+        try:
+            async for token in flight:
+                tokens.append(token)
+                yield token
+        finally:
+            await flight.aclose()
+        # Solo se guarda la respuesta si el stream terminó completo
+        if self.cache is not None:
+            await self.cache.set(key, "".join(tokens), document_id=document_id)
+
     async def generate_explanations(self, content: str, concepts: List[str]) -> str:
         prompt = f"""For these concepts, provide explanations from the content:
 
@@ -58,4 +248,39 @@ Concepts:
 {json.dumps(concepts, indent=2)}
 
 Explanations:"""
-        return self.llm.invoke(prompt)
\ No newline at end of file
+        return await self._generate(prompt)
+
+    async def invalidate_document(self, document_id: int):
+        if self.cache is not None:
+            await self.cache.invalidate_document(document_id)
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate_document(document_id)
+
+    async def aclose(self):
+        await self.llm.aclose()
+        await self.flights.aclose()
+        await self.admission.aclose()
+        if self.cache is not None:
+            await self.cache.aclose()
+
+
+# Instancia única por proceso: la crea el lifespan de FastAPI o el hook
+# worker_process_init de Celery, y comparte el pool de conexiones a Ollama.
+_llm_service: Optional[LLMService] = None
+
+def init_llm_service() -> LLMService:
+    global _llm_service
+    if _llm_service is None:
+        _llm_service = LLMService()
+    return _llm_service
+
+async def close_llm_service():
+    global _llm_service
+    if _llm_service is not None:
+        await _llm_service.aclose()
+        _llm_service = None
+
+def get_llm_service() -> LLMService:
+    if _llm_service is None:
+        raise HTTPException(status_code=503, detail="El servicio LLM no está inicializado")
+    return _llm_service
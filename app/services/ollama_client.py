@@ -0,0 +1,104 @@
+# app/services/ollama_client.py
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+import httpx
+from app.core.config import settings
+
+class OllamaError(Exception):
+    pass
+
+# Solo se reintenta si la petición no llegó a Ollama. Un ReadTimeout significa
+# que Ollama está generando: repetirla multiplicaría la carga justo cuando va lento
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+class OllamaClient:
+    """Cliente asíncrono para la API REST de Ollama con conexiones keep-alive."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        embedding_model: Optional[str] = None,
+        timeout: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_delay: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        num_ctx: Optional[int] = None
+    ):
+        config = settings.get_ollama_config
+        self.base_url = (base_url or config["base_url"]).rstrip("/")
+        self.model = model or config["model"]
+        self.embedding_model = embedding_model or config["embedding_model"]
+        self.timeout = timeout if timeout is not None else config["timeout"]
+        self.max_retries = max_retries if max_retries is not None else config["max_retries"]
+        self.retry_delay = retry_delay if retry_delay is not None else config["retry_delay"]
+        max_connections = max_connections or config["max_connections"]
+        self.num_ctx = num_ctx or config["num_ctx"]
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.post(path, json=payload)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPStatusError as e:
+                # Los errores 4xx (modelo inexistente, prompt inválido) no se reintentan
+                if e.response.status_code < 500:
+                    raise OllamaError(f"Ollama respondió {e.response.status_code}: {e.response.text}")
+                last_error = e
+            except _RETRYABLE_ERRORS as e:
+                last_error = e
+            except httpx.TransportError as e:
+                raise OllamaError(f"Error de conexión con Ollama: {str(e)}")
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_delay * (attempt + 1))
+        raise OllamaError(f"Ollama no respondió tras {self.max_retries + 1} intentos: {str(last_error)}")
+
+    async def generate(self, prompt: str) -> str:
+        payload = {"model": self.model, "prompt": prompt, "stream": False, "options": {"num_ctx": self.num_ctx}}
+        data = await self._post("/api/generate", payload)
+        return data.get("response", "")
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        payload = {"model": self.embedding_model, "input": texts}
+        data = await self._post("/api/embed", payload)
+        return data.get("embeddings", [])
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Genera tokens a medida que Ollama los produce.
+
+        Cerrar el generador (por ejemplo cuando el cliente HTTP se desconecta)
+        cierra la conexión con Ollama, que entonces aborta la generación.
+        """
+        payload = {"model": self.model, "prompt": prompt, "stream": True, "options": {"num_ctx": self.num_ctx}}
+        try:
+            async with self._client.stream("POST", "/api/generate", json=payload) as response:
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    raise OllamaError(f"Ollama respondió {response.status_code}: {body.decode(errors='ignore')}")
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise OllamaError(data["error"])
+                    token = data.get("response")
+                    if token:
+                        yield token
+                    if data.get("done"):
+                        break
+        except httpx.TransportError as e:
+            raise OllamaError(f"Error de conexión con Ollama: {str(e)}")
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,69 @@
+# app/services/progress.py
+from typing import Dict, Optional
+from redis import Redis
+from app.core.config import settings
+
+class ProgressTracker:
+    """Progreso y checkpoints del procesamiento de documentos, guardados en Redis.
+
+    Se indexan por hash del contenido: los documentos duplicados comparten el
+    mismo procesamiento y, por tanto, el mismo progreso.
+
+    Los workers de Celery escriben aquí a medida que avanzan y la API lo lee
+    para informar al cliente. Los checkpoints permiten que una tarea
+    reintentada retome el trabajo ya hecho en lugar de empezar de cero.
+    """
+
+    def __init__(self, redis_client: Optional[Redis] = None, ttl: int = 86400):
+        self.redis = redis_client or Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+        self.ttl = ttl
+
+    @staticmethod
+    def _progress_key(content_hash: str) -> str:
+        return f"doc:{content_hash}:progress"
+
+    @staticmethod
+    def _checkpoint_key(content_hash: str, stage: str) -> str:
+        return f"doc:{content_hash}:checkpoint:{stage}"
+
+    def update(self, content_hash: str, **fields):
+        key = self._progress_key(content_hash)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={name: str(value) for name, value in fields.items()})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def increment(self, content_hash: str, field: str, amount: int = 1) -> int:
+        key = self._progress_key(content_hash)
+        pipe = self.redis.pipeline()
+        pipe.hincrby(key, field, amount)
+        pipe.expire(key, self.ttl)
+        return pipe.execute()[0]
+
+    def get(self, content_hash: str) -> Dict[str, str]:
+        raw = self.redis.hgetall(self._progress_key(content_hash))
+        return {name.decode(): value.decode() for name, value in raw.items()}
+
+    def save_checkpoint(self, content_hash: str, stage: str, index: int, value: str):
+        key = self._checkpoint_key(content_hash, stage)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, str(index), value)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def load_checkpoint(self, content_hash: str, stage: str, index: int) -> Optional[str]:
+        value = self.redis.hget(self._checkpoint_key(content_hash, stage), str(index))
+        return value.decode() if value is not None else None
+
+    def clear_checkpoints(self, content_hash: str):
+        keys = list(self.redis.scan_iter(match=self._checkpoint_key(content_hash, "*")))
+        if keys:
+            self.redis.delete(*keys)
+
+    def clear_progress(self, content_hash: str):
+        """Borra el estado pero conserva los checkpoints: un reintento no repite lo ya resumido."""
+        self.redis.delete(self._progress_key(content_hash))
+
+    def clear(self, content_hash: str):
+        self.clear_checkpoints(content_hash)
+        self.clear_progress(content_hash)
@@ -0,0 +1,144 @@
+# app/services/retrieval.py
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+from .context_builder import BuiltContext, ContextBuilder, count_tokens
+from .llm_service import LLMService
+from .vector_store import VectorStore
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .chunk_store import count_chunks, load_chunks, load_leading_chunks, page_of
+
+async def build_question_context(
+    db: AsyncSession,
+    document: Document,
+    question: str,
+    llm_service: LLMService
+) -> Tuple[BuiltContext, Optional[List[float]]]:
+    """Contexto para responder `question` sobre `document`.
+
+    Si el documento ya está indexado se combinan los candidatos de BM25 (que
+    acierta con identificadores y términos raros) y de la búsqueda vectorial
+    (que acierta con paráfrasis) mediante reciprocal rank fusion. Si todavía
+    no hay índice se cae a la selección léxica de ContextBuilder.
+    De la base de datos solo se leen los fragmentos elegidos.
+    Devuelve también el embedding de la pregunta para reutilizarlo.
+    """
+    builder = ContextBuilder()
+    store = VectorStore()
+    bm25 = BM25Index()
+    owner_id = document.owner_id
+    content_hash = document.content_hash
+    total_chunks = await count_chunks(db, content_hash)
+    if not total_chunks:
+        content = (await db.execute(
+            select(DocumentBlob.content).where(DocumentBlob.sha256 == content_hash)
+        )).scalar()
+        context = await run_in_threadpool(builder.build, content, question)
+        return context, None
+
+    rankings: List[List[int]] = []
+    question_vector = None
+    if await run_in_threadpool(store.exists, owner_id, document.id):
+        try:
+            vectors = await llm_service.embed([question])
+            question_vector = vectors[0]
+            results = await run_in_threadpool(
+                store.search, owner_id, document.id, question_vector, settings.RETRIEVAL_CANDIDATES
+            )
+            rankings.append([ordinal for ordinal, _ in results])
+        except Exception as e:
+            print(f"Error en la recuperación por embeddings: {str(e)}")
+    lexical = await run_in_threadpool(bm25.search, content_hash, question, settings.RETRIEVAL_CANDIDATES)
+    rankings.append([ordinal for ordinal, _ in lexical])
+
+    fused = reciprocal_rank_fusion(rankings, k=settings.RETRIEVAL_RRF_K)[:settings.RETRIEVAL_TOP_K]
+    if fused:
+        chunks = await load_chunks(db, content_hash, fused)
+        ranked = [chunks[ordinal] for ordinal in fused if ordinal in chunks]
+    else:
+        # Sin coincidencias en ningún recuperador se usa el principio del documento
+        ranked = await load_leading_chunks(db, content_hash, settings.RETRIEVAL_TOP_K)
+    return builder.select(ranked, total_chunks), question_vector
+
+async def build_library_context(
+    db: AsyncSession,
+    user_id: int,
+    documents: Dict[int, Tuple[str, str]],
+    question: str,
+    llm_service: LLMService
+) -> Tuple[str, List[dict]]:
+    """Contexto para una pregunta sobre toda la biblioteca del usuario.
+
+    `documents` mapea id -> (título, hash del contenido) de los documentos del
+    usuario; el contenido nunca se lee de la base de datos. Los duplicados se
+    buscan una sola vez. La búsqueda vectorial recorre la matriz
+    del usuario de una pasada y BM25 consulta el índice de cada documento; se
+    fusionan con RRF y solo se leen de la base de datos los fragmentos elegidos.
+    Devuelve el texto con bloques numerados "[n] título" y las citas
+    correspondientes (documento, posición del fragmento y, en los PDF, página).
+    """
+    store = VectorStore()
+    bm25 = BM25Index()
+    candidates = settings.RETRIEVAL_CANDIDATES
+    first_document: Dict[str, int] = {}
+    for document_id, (_, content_hash) in sorted(documents.items()):
+        if content_hash:
+            first_document.setdefault(content_hash, document_id)
+    hashes = {document_id: content_hash for content_hash, document_id in first_document.items()}
+    rankings: List[List[Tuple[int, int]]] = []
+    try:
+        vectors = await llm_service.embed([question])
+        results = await run_in_threadpool(store.search_all, user_id, vectors[0], candidates, hashes)
+        rankings.append([(document_id, ordinal) for document_id, ordinal, _ in results])
+    except Exception as e:
+        print(f"Error en la recuperación por embeddings: {str(e)}")
+    lexical = await run_in_threadpool(bm25.search_all, hashes, question, candidates)
+    rankings.append([(document_id, ordinal) for document_id, ordinal, _ in lexical])
+
+    fused = reciprocal_rank_fusion(rankings, k=settings.RETRIEVAL_RRF_K)[:settings.RETRIEVAL_TOP_K]
+    ordinals_by_document: Dict[int, List[int]] = {}
+    for document_id, ordinal in fused:
+        ordinals_by_document.setdefault(document_id, []).append(ordinal)
+    chunks_by_document = {
+        document_id: await load_chunks(db, hashes[document_id], ordinals)
+        for document_id, ordinals in ordinals_by_document.items()
+    }
+    blocks: List[str] = []
+    citations: List[dict] = []
+    used = 0
+    for document_id, ordinal in fused:
+        chunk = chunks_by_document[document_id].get(ordinal)
+        if chunk is None:
+            continue
+        title = documents[document_id][0]
+        n = len(citations) + 1
+        block = f"[{n}] {title}\n{chunk.text}"
+        tokens = count_tokens(block)
+        if used + tokens > settings.LLM_CONTEXT_BUDGET:
+            continue
+        used += tokens
+        blocks.append(block)
+        citations.append({
+            "n": n,
+            "document_id": document_id,
+            "title": title,
+            "ordinal": chunk.ordinal,
+            "start": chunk.start,
+            "end": chunk.end,
+            # Solo para PDF: página donde empieza el fragmento
+            "page": await page_of(db, hashes[document_id], chunk.start)
+        })
+    return "\n\n".join(blocks), citations
+
+def embed_chunks(chunks, llm_service: LLMService, run) -> List[List[float]]:
+    """Embeddings de los fragmentos por lotes; `run` ejecuta una corrutina de forma síncrona."""
+    vectors: List[List[float]] = []
+    batch_size = settings.EMBEDDING_BATCH_SIZE
+    for i in range(0, len(chunks), batch_size):
+        batch = [chunk.text for chunk in chunks[i:i + batch_size]]
+        vectors.extend(run(llm_service.embed(batch)))
+    return vectors
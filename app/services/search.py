@@ -0,0 +1,90 @@
+# app/services/search.py
+from typing import List
+from sqlalchemy import Select, func, or_, select, true, union
+from sqlalchemy.dialects.postgresql import TSQUERY
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.fulltext import search_configs
+from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+from app.models.document_chunk import DocumentChunk
+
+# Fragmentos de la respuesta con las coincidencias marcadas
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=\" … \""
+
+def _tsquery(text: str):
+    # La consulta se interpreta en cada idioma y basta con que coincida en uno
+    configs = search_configs()
+    query = func.websearch_to_tsquery(configs[0], text)
+    for config in configs[1:]:
+        query = query.op("||", return_type=TSQUERY)(func.websearch_to_tsquery(config, text))
+    return query
+
+def build_search_query(owner_id: int, text: str, limit: int) -> Select:
+    """Consulta de búsqueda de texto completo sobre los documentos de un usuario.
+
+    Las coincidencias son la unión de dos consultas, una por título y otra por
+    contenido, para que cada una use su índice GIN (un OR sobre el join no
+    podría usar ninguno). Se ordenan con ts_rank_cd y, solo para los `limit`
+    mejores, el fragmento (ts_headline) se saca del trozo de document_chunks
+    que mejor coincide: nunca se vuelve a analizar el texto entero.
+    """
+    query = _tsquery(text)
+    matches = union(
+        select(Document.id).where(
+            Document.owner_id == owner_id,
+            Document.title_vector.bool_op("@@")(query)
+        ),
+        select(Document.id)
+        .join(DocumentBlob, DocumentBlob.sha256 == Document.content_hash)
+        .where(Document.owner_id == owner_id, DocumentBlob.search_vector.bool_op("@@")(query))
+    ).subquery()
+    rank = (
+        func.ts_rank_cd(Document.title_vector, query)
+        + func.coalesce(func.ts_rank_cd(DocumentBlob.search_vector, query), 0)
+    )
+    ranked = (
+        select(
+            Document.id,
+            Document.title,
+            Document.created_at,
+            Document.content_hash,
+            rank.label("rank")
+        )
+        .join(matches, matches.c.id == Document.id)
+        .outerjoin(DocumentBlob, DocumentBlob.sha256 == Document.content_hash)
+        .order_by(rank.desc(), Document.id)
+        .limit(limit)
+        .subquery()
+    )
+    # El trozo que mejor coincide; si solo coincide el título, el primero
+    chunk_match = DocumentChunk.search_vector.bool_op("@@")(query)
+    best_chunk = (
+        select(DocumentChunk.text)
+        .where(
+            DocumentChunk.content_hash == ranked.c.content_hash,
+            or_(chunk_match, DocumentChunk.ordinal == 0)
+        )
+        .order_by(chunk_match.desc(), func.ts_rank_cd(DocumentChunk.search_vector, query).desc(), DocumentChunk.ordinal)
+        .limit(1)
+        .lateral()
+    )
+    snippet = func.ts_headline(search_configs()[0], best_chunk.c.text, query, HEADLINE_OPTIONS)
+    return (
+        select(ranked.c.id, ranked.c.title, ranked.c.created_at, ranked.c.rank, snippet.label("snippet"))
+        .select_from(ranked)
+        .outerjoin(best_chunk, true())
+        .order_by(ranked.c.rank.desc(), ranked.c.id)
+    )
+
+async def search_documents(db: AsyncSession, owner_id: int, text: str, limit: int = 20) -> List[dict]:
+    rows = (await db.execute(build_search_query(owner_id, text, limit))).all()
+    return [
+        {
+            "id": row.id,
+            "title": row.title,
+            "created_at": row.created_at,
+            "rank": float(row.rank),
+            "snippet": row.snippet
+        }
+        for row in rows
+    ]
@@ -0,0 +1,84 @@
+# app/services/semantic_cache.py
+from typing import Dict, List, Optional
+import numpy as np
+
+class _DocumentEntries:
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.answers: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def append(self, vector: np.ndarray, answer: str):
+        size = len(self.answers)
+        if size == self.vectors.shape[0]:
+            grown = np.empty((size * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:size] = self.vectors
+            self.vectors = grown
+        self.vectors[size] = vector
+        self.answers.append(answer)
+
+    def drop_oldest(self, count: int):
+        size = len(self.answers)
+        self.vectors[:size - count] = self.vectors[count:size]
+        del self.answers[:count]
+
+class SemanticCache:
+    """Caché de respuestas por similitud coseno entre preguntas de un mismo documento.
+
+    Los vectores se guardan normalizados en una matriz float32 por documento,
+    así una búsqueda es un único producto matriz-vector.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_per_document: int = 5000):
+        self.threshold = threshold
+        self.max_per_document = max_per_document
+        self._documents: Dict[int, _DocumentEntries] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(self, document_id: int, vector) -> Optional[str]:
+        entries = self._documents.get(document_id)
+        query = self._normalize(vector)
+        if entries is None or query is None or len(entries) == 0 \
+                or entries.vectors.shape[1] != query.shape[0]:
+            self.misses += 1
+            return None
+        scores = entries.vectors[:len(entries)] @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            self.hits += 1
+            return entries.answers[best]
+        self.misses += 1
+        return None
+
+    def add(self, document_id: int, vector, answer: str):
+        query = self._normalize(vector)
+        if query is None:
+            return
+        entries = self._documents.get(document_id)
+        if entries is None or entries.vectors.shape[1] != query.shape[0]:
+            entries = self._documents[document_id] = _DocumentEntries(query.shape[0])
+        if len(entries) >= self.max_per_document:
+            entries.drop_oldest(len(entries) - self.max_per_document + 1)
+        entries.append(query, answer)
+
+    def invalidate_document(self, document_id: int):
+        self._documents.pop(document_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._documents),
+            "questions": sum(len(entries) for entries in self._documents.values()),
+            "hits": self.hits,
+            "misses": self.misses
+        }
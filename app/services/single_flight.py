@@ -0,0 +1,243 @@
+# app/services/single_flight.py
+import asyncio
+import json
+import time
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from redis import asyncio as aioredis
+from app.core.config import settings
+
+# Solo borra el lock si sigue siendo del líder que lo tomó: si la generación
+# duró más que lock_ttl, el lock puede ser ya de otro worker
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class _StreamFlight:
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def push(self, token: str):
+        async with self._changed:
+            self.tokens.append(token)
+            self._changed.notify_all()
+
+    async def finish(self, error: Optional[BaseException] = None):
+        async with self._changed:
+            self.error = error
+            self.done = True
+            self._changed.notify_all()
+
+    async def wait(self, seen: int):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.done or len(self.tokens) > seen)
+
+class _CallFlight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Agrupa peticiones idénticas concurrentes en una sola generación.
+
+    Dentro del proceso los llamantes con la misma clave esperan la misma
+    tarea (o se suscriben al mismo stream), que no depende de ninguno de
+    ellos: si uno se cancela los demás siguen esperando, y la generación
+    solo se cancela cuando ya no queda nadie. Entre workers, el primero que
+    toma el lock en Redis genera y publica el resultado por pub/sub; los demás
+    lo esperan y, si el líder desaparece, generan por su cuenta.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[aioredis.Redis] = None,
+        lock_ttl: int = 120,
+        wait_timeout: int = 120
+    ):
+        self.redis = redis_client
+        self._release = redis_client.register_script(_RELEASE_SCRIPT) if redis_client is not None else None
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _CallFlight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_coalesced = 0
+
+    @classmethod
+    def from_settings(cls) -> "SingleFlight":
+        redis_client = None
+        if settings.SINGLE_FLIGHT_REDIS_ENABLED:
+            redis_client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=settings.LLM_CACHE_REDIS_DB
+            )
+        return cls(
+            redis_client=redis_client,
+            lock_ttl=settings.SINGLE_FLIGHT_LOCK_TTL,
+            wait_timeout=settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+        )
+
+    @staticmethod
+    def _lock_key(key: str) -> str:
+        return f"llm:flight:lock:{key}"
+
+    @staticmethod
+    def _channel(key: str) -> str:
+        return f"llm:flight:{key}"
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = self._calls[key] = _CallFlight(asyncio.create_task(self._run(key, fn)))
+            flight.task.add_done_callback(lambda _: self._forget_call(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            # Si todos los llamantes se fueron se cancela la generación
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _forget_call(self, key: str, flight: _CallFlight):
+        if self._calls.get(key) is flight:
+            del self._calls[key]
+        # Evita el aviso "exception was never retrieved" si nadie esperaba ya el resultado
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _StreamFlight()
+            flight.task = asyncio.create_task(self._drive(key, flight, factory))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.subscribers += 1
+        try:
+            seen = 0
+            while True:
+                while seen < len(flight.tokens):
+                    yield flight.tokens[seen]
+                    seen += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait(seen)
+        finally:
+            flight.subscribers -= 1
+            # Si todos los clientes se fueron se cancela la generación aguas arriba
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+
+    async def _drive(self, key: str, flight: _StreamFlight, factory: Callable[[], AsyncIterator[str]]):
+        try:
+            async def generate() -> str:
+                tokens = factory()
+                try:
+                    async for token in tokens:
+                        await flight.push(token)
+                finally:
+                    await tokens.aclose()
+                return "".join(flight.tokens)
+
+            result = await self._run(key, generate)
+            # Un seguidor remoto recibe la respuesta completa de una vez
+            if not flight.tokens:
+                await flight.push(result)
+            await flight.finish()
+        except asyncio.CancelledError:
+            await flight.finish(RuntimeError("Generación cancelada"))
+        except Exception as e:
+            await flight.finish(e)
+        finally:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        if self.redis is None:
+            return await fn()
+
+        lock_key = self._lock_key(key)
+        token = uuid.uuid4().hex
+        try:
+            leader = await self.redis.set(lock_key, token, nx=True, ex=self.lock_ttl)
+        except Exception as e:
+            print(f"Error tomando lock de single-flight en Redis: {str(e)}")
+            return await fn()
+
+        if not leader:
+            result = await self._wait_remote(key)
+            if result is not None:
+                self.remote_coalesced += 1
+                return result
+            return await fn()
+
+        message = None
+        try:
+            result = await fn()
+            message = {"result": result}
+            return result
+        except BaseException as e:
+            message = {"error": str(e)}
+            raise
+        finally:
+            try:
+                await self.redis.publish(self._channel(key), json.dumps(message))
+                await self._release(keys=[lock_key], args=[token])
+            except Exception as e:
+                print(f"Error publicando resultado de single-flight: {str(e)}")
+
+    async def _wait_remote(self, key: str) -> Optional[str]:
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(self._channel(key))
+            # El líder pudo terminar antes de la suscripción
+            if not await self.redis.exists(self._lock_key(key)):
+                return None
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    return json.loads(message["data"]).get("result")
+                if not await self.redis.exists(self._lock_key(key)):
+                    return None
+            return None
+        except Exception as e:
+            print(f"Error esperando resultado de single-flight: {str(e)}")
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe()
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_coalesced": self.remote_coalesced
+        }
+
+    async def aclose(self):
+        if self.redis is not None:
+            await self.redis.aclose()
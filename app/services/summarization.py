@@ -0,0 +1,156 @@
+# app/services/summarization.py
+from typing import Iterable, List, Optional
+from celery import chord
+from .celery_config import celery_app, run_async
+from .llm_service import init_llm_service
+from .progress import ProgressTracker
+from .context_builder import ContextChunk
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.document_blob import DocumentBlob
+
+# Con acks_late una tarea cuyo worker muere se vuelve a entregar a otro,
+# que retoma desde los checkpoints guardados en Redis
+TASK_OPTIONS = dict(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=3
+)
+
+class SummaryGrouper:
+    """Agrupa fragmentos consecutivos en trozos de unos `size` caracteres para el map.
+
+    Los fragmentos de recuperación se solapan; aquí se descarta la parte
+    repetida para no resumir dos veces el mismo texto. Recibe los fragmentos
+    de uno en uno, a medida que salen del chunker.
+    """
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or settings.SUMMARY_CHUNK_SIZE
+        self.groups: List[str] = []
+        self._current: List[str] = []
+        self._length = 0
+        self._covered = 0
+
+    def add(self, chunk: ContextChunk):
+        text = chunk.text[max(0, self._covered - chunk.start):]
+        self._covered = max(self._covered, chunk.end)
+        if not text.strip():
+            return
+        if self._current and self._length + len(text) > self.size:
+            self.groups.append("\n\n".join(self._current))
+            self._current, self._length = [], 0
+        self._current.append(text)
+        self._length += len(text)
+
+    def finish(self) -> List[str]:
+        if self._current:
+            self.groups.append("\n\n".join(self._current))
+            self._current, self._length = [], 0
+        return self.groups
+
+def group_for_summary(chunks: Iterable[ContextChunk], size: Optional[int] = None) -> List[str]:
+    grouper = SummaryGrouper(size)
+    for chunk in chunks:
+        grouper.add(chunk)
+    return grouper.finish()
+
+def update_blob(content_hash: str, **fields):
+    """Actualiza el contenido compartido; no hace nada si ya se borró."""
+    db = SessionLocal()
+    try:
+        blob = db.query(DocumentBlob).filter(DocumentBlob.sha256 == content_hash).first()
+        if blob is not None:
+            for name, value in fields.items():
+                setattr(blob, name, value)
+            db.commit()
+    finally:
+        db.close()
+
+def start_summary_pipeline(content_hash: str, chunks: List[str], user_id: Optional[int] = None):
+    tracker = ProgressTracker()
+    if not chunks:
+        update_blob(content_hash, status="ready")
+        tracker.update(
+            content_hash,
+            status="ready",
+            stage="done",
+            summary_stage="done",
+            summary_total_chunks=0,
+            summary_done_chunks=0
+        )
+        return
+    tracker.update(
+        content_hash,
+        summary_stage="map",
+        summary_total_chunks=len(chunks),
+        summary_done_chunks=0
+    )
+    chord(
+        summarize_chunk_task.s(content_hash, index, chunk, user_id)
+        for index, chunk in enumerate(chunks)
+    )(reduce_summaries_task.s(content_hash, user_id).on_error(summary_failed_task.s(content_hash)))
+
+@celery_app.task
+def summary_failed_task(request, exc, traceback, content_hash: str):
+    """Errback del chord: un fragmento o la reducción agotó sus reintentos.
+
+    Sin él el contenido se quedaría en "processing" para siempre.
+    """
+    detail = f"Error generando el resumen: {exc}"
+    print(f"Error summarizing content {content_hash}: {exc}")
+    update_blob(content_hash, status="failed", error=detail)
+    ProgressTracker().update(
+        content_hash,
+        status="failed",
+        stage="failed",
+        summary_stage="failed",
+        error=detail
+    )
+
+@celery_app.task(**TASK_OPTIONS)
+def summarize_chunk_task(content_hash: str, index: int, chunk: str, user_id: Optional[int] = None) -> str:
+    tracker = ProgressTracker()
+    summary = tracker.load_checkpoint(content_hash, "map", index)
+    if summary is not None:
+        return summary
+
+    llm_service = init_llm_service()
+    summary = run_async(llm_service.generate_summary(chunk, user_id=user_id))
+    tracker.save_checkpoint(content_hash, "map", index, summary)
+    tracker.increment(content_hash, "summary_done_chunks")
+    return summary
+
+@celery_app.task(**TASK_OPTIONS)
+def reduce_summaries_task(summaries: List[str], content_hash: str, user_id: Optional[int] = None) -> str:
+    tracker = ProgressTracker()
+    llm_service = init_llm_service()
+    fanout = max(2, settings.SUMMARY_REDUCE_FANOUT)
+
+    # Reducción jerárquica: se combinan grupos de `fanout` resúmenes por nivel
+    level = 0
+    while len(summaries) > 1:
+        level += 1
+        stage = f"reduce:{level}"
+        tracker.update(content_hash, summary_stage=stage)
+        combined = []
+        for index in range(0, len(summaries), fanout):
+            group = index // fanout
+            summary = tracker.load_checkpoint(content_hash, stage, group)
+            if summary is None:
+                summary = run_async(
+                    llm_service.combine_summaries(summaries[index:index + fanout], user_id=user_id)
+                )
+                tracker.save_checkpoint(content_hash, stage, group, summary)
+            combined.append(summary)
+        summaries = combined
+
+    summary = summaries[0] if summaries else "No summary available"
+
+    # El resumen se guarda una vez por contenido y lo ven todos sus documentos
+    update_blob(content_hash, summary=summary, status="ready")
+    tracker.update(content_hash, status="ready", stage="done", summary_stage="done")
+    tracker.clear_checkpoints(content_hash)
+    return summary
@@ -0,0 +1,284 @@
+# app/services/vector_store.py
+import fcntl
+import json
+import os
+import shutil
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+
+_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+class VectorStore:
+    """Almacén de embeddings por usuario en disco, mapeado en memoria.
+
+    Los embeddings dependen solo del contenido: se guardan una vez por SHA-256
+    en blobs/{hash}/embeddings.npy, normalizados en float16, y de ahí se
+    copian las filas al índice de cada usuario sin volver a llamar al LLM.
+    Los fragmentos a los que corresponde cada fila están en document_chunks.
+
+    Cada usuario tiene además un directorio con su índice de búsqueda:
+      - vectors.{gen}.bin: matriz de vectores normalizados y cuantizados (int8
+        o float16), una fila por fragmento, de solo anexado;
+      - scales.{gen}.bin: factor float32 por fila para deshacer la cuantización;
+      - header.json: generación, dimensión, tipo, número de filas y el rango de
+        filas de cada documento.
+
+    Los procesos de la API abren los ficheros con np.memmap de solo lectura,
+    así comparten la page cache del sistema en lugar de duplicar matrices. Las
+    escrituras (Celery al procesar, la API al borrar) se serializan con flock
+    y publican el header con un rename atómico, de modo que un lector siempre
+    ve un header coherente con lo ya escrito. La compactación escribe una
+    generación nueva de ficheros y solo borra la anterior tras publicar el
+    header que apunta a la nueva.
+    """
+
+    # Mapas abiertos compartidos por todas las instancias del proceso
+    _maps: "OrderedDict[str, Tuple[Tuple[int, int], np.memmap]]" = OrderedDict()
+    _max_maps = 256
+
+    def __init__(self, directory: Optional[str] = None, dtype: Optional[str] = None, batch_rows: Optional[int] = None):
+        self.directory = directory or settings.VECTOR_STORE_DIR
+        self.dtype = dtype or settings.VECTOR_STORE_DTYPE
+        self.batch_rows = batch_rows or settings.VECTOR_SEARCH_BATCH_ROWS
+
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.directory, str(user_id))
+
+    def _path(self, user_id: int, name: str) -> str:
+        return os.path.join(self._user_dir(user_id), name)
+
+    def _blob_path(self, content_hash: str, name: str) -> str:
+        return os.path.join(self.directory, "blobs", content_hash, name)
+
+    @contextmanager
+    def _locked(self, user_id: int):
+        os.makedirs(self._user_dir(user_id), exist_ok=True)
+        with open(self._path(user_id, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_header(self, user_id: int) -> Optional[dict]:
+        try:
+            with open(self._path(user_id, "header.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_header(self, user_id: int, header: dict):
+        path = self._path(user_id, "header.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+        if dtype == "int8":
+            # Cuantización simétrica por fila: fila ≈ codes * scale
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.round(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vectors.astype(np.float16), np.ones(vectors.shape[0], dtype=np.float32)
+
+    def _memmap(self, path: str, dtype, count: int, dim: Optional[int] = None) -> np.ndarray:
+        shape = (count, dim) if dim else (count,)
+        if count == 0:
+            return np.empty(shape, dtype=dtype)
+        stat = os.stat(path)
+        # Se reabre si el fichero creció (anexado) o se sustituyó (compactación)
+        signature = (stat.st_ino, stat.st_size)
+        cached = self._maps.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, np.memmap(path, dtype=dtype, mode="r"))
+            self._maps[path] = cached
+            while len(self._maps) > self._max_maps:
+                self._maps.popitem(last=False)
+        self._maps.move_to_end(path)
+        # Solo las filas publicadas en el header, aunque haya un anexado en curso
+        return cached[1][:count * (dim or 1)].reshape(shape)
+
+    def _data_paths(self, user_id: int, generation: int) -> Tuple[str, str]:
+        return (
+            self._path(user_id, f"vectors.{generation}.bin"),
+            self._path(user_id, f"scales.{generation}.bin")
+        )
+
+    def _matrices(self, user_id: int, header: dict) -> Tuple[np.ndarray, np.ndarray]:
+        count, dim = header["count"], header["dim"]
+        vectors_path, scales_path = self._data_paths(user_id, header["generation"])
+        vectors = self._memmap(vectors_path, _DTYPES[header["dtype"]], count, dim)
+        scales = self._memmap(scales_path, np.float32, count)
+        return vectors, scales
+
+    def _snapshot(self, user_id: int) -> Tuple[Optional[dict], Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """Header y matrices consistentes entre sí, aunque haya una compactación en curso."""
+        for _ in range(3):
+            header = self.read_header(user_id)
+            if header is None:
+                return None, None
+            try:
+                return header, self._matrices(user_id, header)
+            except FileNotFoundError:
+                # La generación leída acaba de ser sustituida: se relee el header
+                continue
+        raise RuntimeError(f"No se pudo leer el almacén de vectores del usuario {user_id}")
+
+    def save_embeddings(self, content_hash: str, vectors):
+        path = self._blob_path(content_hash, "embeddings.npy")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            np.save(f, self.normalize(vectors).astype(np.float16))
+        os.replace(f"{path}.tmp", path)
+
+    def load_embeddings(self, content_hash: str) -> Optional[np.ndarray]:
+        try:
+            return np.load(self._blob_path(content_hash, "embeddings.npy"))
+        except FileNotFoundError:
+            return None
+
+    def delete_blob(self, content_hash: str):
+        shutil.rmtree(os.path.join(self.directory, "blobs", content_hash), ignore_errors=True)
+
+    def save(self, user_id: int, document_id: int, vectors):
+        matrix = self.normalize(vectors)
+        with self._locked(user_id):
+            header = self.read_header(user_id) or {
+                "generation": 0,
+                "dim": int(matrix.shape[1]),
+                "dtype": self.dtype,
+                "count": 0,
+                "documents": {}
+            }
+            if header["dim"] != matrix.shape[1]:
+                raise ValueError(
+                    f"Dimensión de embedding {matrix.shape[1]} distinta de la del almacén ({header['dim']})"
+                )
+            if str(document_id) in header["documents"]:
+                self._compact(user_id, header, {str(document_id)})
+
+            codes, scales = self.quantize(matrix, header["dtype"])
+            vectors_path, scales_path = self._data_paths(user_id, header["generation"])
+            # Anexado incremental: solo se escriben las filas nuevas, descartando
+            # lo que hubiera dejado un escritor que murió antes de publicar el header
+            with open(vectors_path, "ab") as f:
+                f.truncate(header["count"] * header["dim"] * codes.itemsize)
+                f.write(codes.tobytes())
+            with open(scales_path, "ab") as f:
+                f.truncate(header["count"] * 4)
+                f.write(scales.tobytes())
+
+            header["documents"][str(document_id)] = [header["count"], int(codes.shape[0])]
+            header["count"] += int(codes.shape[0])
+            self._write_header(user_id, header)
+
+    def delete(self, user_id: int, document_id: int):
+        if not os.path.isdir(self._user_dir(user_id)):
+            return
+        with self._locked(user_id):
+            header = self.read_header(user_id)
+            if header is not None and str(document_id) in header["documents"]:
+                self._compact(user_id, header, {str(document_id)})
+
+    def _compact(self, user_id: int, header: dict, removed: set):
+        """Escribe una generación nueva sin las filas de `removed` y la publica."""
+        vectors, scales = self._matrices(user_id, header)
+        kept = sorted(
+            ((doc_id, span) for doc_id, span in header["documents"].items() if doc_id not in removed),
+            key=lambda item: item[1][0]
+        )
+        old_paths = self._data_paths(user_id, header["generation"])
+        generation = header["generation"] + 1
+        vectors_path, scales_path = self._data_paths(user_id, generation)
+        documents = {}
+        row = 0
+        with open(vectors_path, "wb") as vf, open(scales_path, "wb") as sf:
+            for doc_id, (start, rows) in kept:
+                vf.write(np.ascontiguousarray(vectors[start:start + rows]).tobytes())
+                sf.write(np.ascontiguousarray(scales[start:start + rows]).tobytes())
+                documents[doc_id] = [row, rows]
+                row += rows
+        header["generation"] = generation
+        header["documents"] = documents
+        header["count"] = row
+        self._write_header(user_id, header)
+        # Los lectores que ya tenían mapeada la generación vieja la conservan hasta soltarla
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def exists(self, user_id: int, document_id: int) -> bool:
+        header = self.read_header(user_id)
+        return header is not None and str(document_id) in header["documents"]
+
+    def count(self, user_id: int, document_id: int) -> int:
+        header = self.read_header(user_id)
+        if header is None or str(document_id) not in header["documents"]:
+            return 0
+        return header["documents"][str(document_id)][1]
+
+    def _scan(self, vectors: np.ndarray, scales: np.ndarray, spans: Iterable[Tuple[int, int]], query: np.ndarray, k: int):
+        """Top-k (fila, score) recorriendo las filas por lotes para acotar la memoria."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, rows in spans:
+            for offset in range(start, start + rows, self.batch_rows):
+                stop = min(offset + self.batch_rows, start + rows)
+                scores = (vectors[offset:stop].astype(np.float32) @ query) * scales[offset:stop]
+                best_rows = np.concatenate([best_rows, np.arange(offset, stop)])
+                best_scores = np.concatenate([best_scores, scores])
+                if best_scores.shape[0] > k:
+                    top = np.argpartition(-best_scores, k - 1)[:k]
+                    best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def search(self, user_id: int, document_id: int, query, k: int) -> List[Tuple[int, float]]:
+        """Devuelve hasta k pares (ordinal del fragmento, score coseno)."""
+        header, matrices = self._snapshot(user_id)
+        if header is None or str(document_id) not in header["documents"] or k <= 0:
+            return []
+        start, rows = header["documents"][str(document_id)]
+        vectors, scales = matrices
+        query = self.normalize(query)[0]
+        top_rows, top_scores = self._scan(vectors, scales, [(start, rows)], query, k)
+        return [(int(row - start), float(score)) for row, score in zip(top_rows, top_scores)]
+
+    def search_all(self, user_id: int, query, k: int, document_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, int, float]]:
+        """Top-k sobre toda la biblioteca del usuario: (document_id, ordinal, score).
+
+        Recorre la matriz completa del usuario (o solo las filas de `document_ids`)
+        sin cargar ningún documento; los fragmentos se leen después solo para
+        los resultados.
+        """
+        header, matrices = self._snapshot(user_id)
+        if header is None or k <= 0:
+            return []
+        documents = header["documents"]
+        if document_ids is not None:
+            wanted = {str(document_id) for document_id in document_ids}
+            documents = {doc_id: span for doc_id, span in documents.items() if doc_id in wanted}
+        if not documents:
+            return []
+        vectors, scales = matrices
+        spans = sorted((start, rows, int(doc_id)) for doc_id, (start, rows) in documents.items())
+        query = self.normalize(query)[0]
+        top_rows, top_scores = self._scan(vectors, scales, [(start, rows) for start, rows, _ in spans], query, k)
+        starts = np.array([start for start, _, _ in spans])
+        owners = np.searchsorted(starts, top_rows, side="right") - 1
+        return [
+            (spans[owner][2], int(row - spans[owner][0]), float(score))
+            for owner, row, score in zip(owners, top_rows, top_scores)
+        ]
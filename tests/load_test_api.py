@@ -0,0 +1,86 @@
+"""Prueba de carga de la API contra una instancia real con Postgres.
+
+Mide cuántas peticiones concurrentes sostiene un único worker de uvicorn en
+endpoints que solo consultan la base de datos. Para comparar con la versión
+síncrona se arranca la API con cada versión y se lanza este script:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    python tests/load_test_api.py --url http://localhost:8000 --concurrency 10 50 100 200
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+import uuid
+import httpx
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ["/api/v1/users/me", "/api/v1/documents/documents"]
+
+async def get_token(client: httpx.AsyncClient) -> str:
+    email = f"carga-{uuid.uuid4().hex[:8]}@example.com"
+    password = "carga-12345"
+    response = await client.post("/api/v1/auth/register", json={"email": email, "password": password})
+    response.raise_for_status()
+    response = await client.post("/api/v1/auth/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run_level(client: httpx.AsyncClient, token: str, concurrency: int, duration: float) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def user(n: int):
+        nonlocal errors
+        i = n
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(ENDPOINTS[i % len(ENDPOINTS)], headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests_per_second": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+        "errors": errors
+    }
+
+async def main(url: str, levels: list, duration: float):
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        token = await get_token(client)
+        for concurrency in levels:
+            result = await run_level(client, token, concurrency, duration)
+            logger.info(
+                f"{result['concurrency']:>4} concurrentes: {result['requests_per_second']:.0f} req/s, "
+                f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, errores {result['errors']}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga de los endpoints de base de datos")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 100, 200])
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.concurrency, args.duration))
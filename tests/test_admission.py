@@ -0,0 +1,147 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController, OverloadedError, INTERACTIVE, BACKGROUND
+
+@pytest.mark.asyncio
+async def test_limits_concurrent_generations():
+    controller = AdmissionController(max_in_flight=2, max_queue=10, queue_timeout=5)
+    running = []
+    peak = []
+
+    async def job():
+        async with controller.slot():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.02)
+            running.pop()
+
+    await asyncio.gather(*[job() for _ in range(6)])
+    assert max(peak) == 2
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["admitted"] == 6
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    await controller.acquire()
+    waiter = asyncio.create_task(controller.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(OverloadedError) as exc_info:
+        await controller.acquire()
+    assert exc_info.value.retry_after >= 1
+    controller.release()
+    await waiter
+    controller.release()
+    assert controller.stats()["rejected_queue_full"] == 1
+
+@pytest.mark.asyncio
+async def test_queue_deadline():
+    controller = AdmissionController(max_in_flight=1, max_queue=5, queue_timeout=0.01)
+    await controller.acquire()
+    with pytest.raises(OverloadedError):
+        await controller.acquire()
+    controller.release()
+    stats = controller.stats()
+    assert stats["rejected_timeout"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_users_are_served_round_robin():
+    controller = AdmissionController(max_in_flight=1, max_queue=100, queue_timeout=5)
+    order = []
+
+    async def job(user):
+        async with controller.slot(user, BACKGROUND):
+            order.append(user)
+            await asyncio.sleep(0.001)
+
+    await controller.acquire("blocker")
+    tasks = [asyncio.create_task(job("batch")) for _ in range(5)]
+    tasks.append(asyncio.create_task(job("other")))
+    await asyncio.sleep(0)
+    controller.release()
+    await asyncio.gather(*tasks)
+    # "other" no espera a que terminen los cinco trabajos de "batch"
+    assert order.index("other") <= 1
+
+@pytest.mark.asyncio
+async def test_interactive_goes_before_background():
+    controller = AdmissionController(max_in_flight=1, max_queue=100, queue_timeout=5)
+    order = []
+
+    async def job(user, priority):
+        async with controller.slot(user, priority):
+            order.append(priority)
+            await asyncio.sleep(0.001)
+
+    await controller.acquire("blocker")
+    tasks = [asyncio.create_task(job("batch", BACKGROUND)) for _ in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(job("reader", INTERACTIVE)))
+    await asyncio.sleep(0)
+    controller.release()
+    await asyncio.gather(*tasks)
+    assert order[0] == INTERACTIVE
+
+@pytest.mark.asyncio
+async def test_background_leaves_a_slot_for_interactive():
+    controller = AdmissionController(max_in_flight=2, max_queue=100, queue_timeout=5)
+    await controller.acquire("batch", BACKGROUND)
+    waiter = asyncio.create_task(controller.acquire("batch", BACKGROUND))
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    await asyncio.wait_for(controller.acquire("reader", INTERACTIVE), timeout=1)
+    controller.release(INTERACTIVE)
+    controller.release(BACKGROUND)
+    await waiter
+    controller.release(BACKGROUND)
+    assert controller.stats()["in_flight"] == 0
+
+class FakeSharedSlots:
+    """Slots globales en memoria con la misma interfaz que SharedSlots."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.held = set()
+        self.requests = []
+
+    async def acquire(self, priority=INTERACTIVE, timeout=None):
+        self.requests.append((priority, timeout))
+        if len(self.held) >= self.capacity:
+            return None
+        token = f"t{len(self.requests)}"
+        self.held.add(token)
+        return token
+
+    async def release(self, token):
+        self.held.discard(token)
+
+@pytest.mark.asyncio
+async def test_shared_slots_bound_every_process():
+    shared = FakeSharedSlots(capacity=1)
+    api = AdmissionController(max_in_flight=2, max_queue=10, queue_timeout=0.01, shared=shared)
+    worker = AdmissionController(max_in_flight=2, max_queue=10, queue_timeout=0.01, shared=shared)
+    async with worker.slot("batch", BACKGROUND):
+        assert len(shared.held) == 1
+        # El proceso de la API tiene slots locales libres, pero no globales
+        with pytest.raises(OverloadedError):
+            async with api.slot("user"):
+                pass
+    assert shared.held == set()
+    assert api.stats()["in_flight"] == 0
+    assert api.stats()["rejected_timeout"] == 1
+    # Solo las preguntas interactivas tienen plazo en la cola global
+    assert shared.requests == [(BACKGROUND, None), (INTERACTIVE, 0.01)]
+
+@pytest.mark.asyncio
+async def test_local_limit_applies_when_redis_fails():
+    class BrokenSlots:
+        async def acquire(self, priority=INTERACTIVE, timeout=None):
+            raise ConnectionError("redis caído")
+
+    controller = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5, shared=BrokenSlots())
+    async with controller.slot():
+        assert controller.stats()["in_flight"] == 1
+    assert controller.stats()["shared_errors"] == 1
+    assert controller.stats()["in_flight"] == 0
@@ -0,0 +1,69 @@
+import time
+import numpy as np
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+def test_tokenize_keeps_identifiers_and_strips_accents():
+    tokens = tokenize("¿Quién fabrica la pieza XK-4471?")
+    assert "quien" in tokens
+    assert "xk-4471" in tokens
+    assert "4471" in tokens
+
+def test_search_finds_rare_identifier(tmp_path):
+    index = BM25Index(directory=str(tmp_path))
+    texts = [f"Mantenimiento general del equipo, sección {i}." for i in range(50)]
+    texts[31] = "Sustituir el rodamiento XK-4471 cada 500 horas."
+    index.save("h9", texts)
+    results = index.search("h9", "¿cada cuánto se cambia el XK-4471?", k=3)
+    assert results[0][0] == 31
+
+def test_search_without_matches(tmp_path):
+    index = BM25Index(directory=str(tmp_path))
+    index.save("h9", ["uno", "dos"])
+    assert index.search("h9", "tres", k=3) == []
+    index.delete("h9")
+    assert index.search("h9", "uno", k=3) == []
+
+def test_long_tokens_do_not_bloat_the_vocabulary(tmp_path):
+    url = "https://example.com/" + "a" * 5000 + "/informe.pdf"
+    index = BM25Index(directory=str(tmp_path))
+    index.save("h9", [f"Ver {url} para el informe"] + [f"sección {i}" for i in range(1000)])
+    postings = index._load("h9")
+    assert postings.term_bytes.nbytes < 20000
+    assert index.search("h9", "informe", k=1)[0][0] == 0
+    assert index.search("h9", "sección 7", k=1)[0][0] == 8
+
+def test_loads_indexes_saved_with_string_vocabulary(tmp_path):
+    index = BM25Index(directory=str(tmp_path))
+    index.save("h9", ["pieza XK-4471", "cojinete"])
+    postings = index._load("h9")
+    path = index._path("h9")
+    terms = [postings._term(i).decode("utf-8") for i in range(postings.term_offsets.shape[0] - 1)]
+    np.savez(
+        path,
+        terms=np.array(terms, dtype=np.str_),
+        term_ptr=postings.term_ptr,
+        chunk_ids=postings.chunk_ids,
+        freqs=postings.freqs,
+        chunk_lengths=postings.chunk_lengths
+    )
+    index._cache.clear()
+    assert index.search("h9", "cojinete", k=1)[0][0] == 1
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])[:2] == [1, 3]
+
+def test_query_latency_at_10k_chunks(tmp_path):
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"termino{i}" for i in range(20000)])
+    texts = [" ".join(rng.choice(vocabulary, size=120)) for _ in range(10000)]
+    index = BM25Index(directory=str(tmp_path))
+    start = time.perf_counter()
+    index.save("h1", texts)
+    build = time.perf_counter() - start
+    index.search("h1", "termino1 termino2", k=10)
+    start = time.perf_counter()
+    for i in range(50):
+        index.search("h1", f"termino{i} termino{i + 100} termino{i + 200}", k=10)
+    query = (time.perf_counter() - start) / 50
+    print(f"BM25 10k fragmentos: construcción {build:.2f} s, consulta media {query * 1000:.2f} ms")
+    assert query < 0.05
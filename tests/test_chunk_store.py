@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+import app.db  # noqa: F401 - registra todos los modelos
+from app.models.document_chunk import DocumentChunk
+from app.models.document_page import DocumentPage
+from app.services.chunk_store import PAGE_SEPARATOR, has_pages, iter_page_segments, save_chunks, save_pages
+from app.services.context_builder import StreamingChunker
+
+# La columna generada search_vector es de Postgres: en SQLite se guarda como texto
+@compiles(TSVECTOR, "sqlite")
+def _tsvector_as_text(type_, compiler, **kw):
+    return "TEXT"
+
+def _fulltext_functions(connection, _):
+    connection.create_function("to_tsvector", 2, lambda config, text: text, deterministic=True)
+    connection.create_function("setweight", 2, lambda vector, weight: vector, deterministic=True)
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'chunks.db'}")
+    event.listen(engine, "connect", _fulltext_functions)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    DocumentChunk.__table__.create(engine)
+    DocumentPage.__table__.create(engine)
+    with Session(engine) as session:
+        session.statements = statements
+        yield session
+
+def test_pages_are_stored_with_offsets_into_the_content(db):
+    pages = ["primera página", "segunda", "tercera con ñ"]
+    save_pages(db, "abc", pages)
+    db.commit()
+    content = "".join(page + PAGE_SEPARATOR for page in pages)
+    assert has_pages(db, "abc") and not has_pages(db, "otro")
+    assert "".join(iter_page_segments(db, "abc", batch_size=2)) == content
+    rows = db.query(DocumentPage).order_by(DocumentPage.number).all()
+    assert [row.number for row in rows] == [1, 2, 3]
+    assert content[rows[1].start_offset:rows[1].end_offset] == "segunda" + PAGE_SEPARATOR
+
+def test_chunks_are_bulk_inserted_and_replaced_on_retry(db):
+    content = "\n\n".join(f"Párrafo {i} " + "texto " * 40 for i in range(30))
+    chunks = list(StreamingChunker(chunk_tokens=60, overlap_tokens=0).chunks([content]))
+    del db.statements[:]
+    save_chunks(db, "abc", chunks)
+    save_chunks(db, "abc", chunks)
+    db.commit()
+    # Un DELETE y un único INSERT múltiple por llamada, no uno por fragmento
+    inserts = [statement for statement in db.statements if statement.startswith("INSERT")]
+    assert len(chunks) > 10 and len(inserts) == 2
+    rows = db.query(DocumentChunk).order_by(DocumentChunk.ordinal).all()
+    assert len(rows) == len(chunks)
+    assert rows[3].text == chunks[3].text == content[rows[3].start_offset:rows[3].end_offset]
+    assert rows[3].tokens == chunks[3].tokens
+
+def test_chunks_can_be_appended_in_batches_while_reading_pages(db):
+    save_pages(db, "abc", [f"Página {i} " + "texto " * 30 for i in range(5)])
+    db.commit()
+    chunker = StreamingChunker(chunk_tokens=20, overlap_tokens=0)
+    saved = 0
+    for chunk in chunker.chunks(iter_page_segments(db, "abc", batch_size=2)):
+        save_chunks(db, "abc", [chunk], replace=saved == 0)
+        # El commit entre lotes no corta la lectura de páginas
+        db.commit()
+        saved += 1
+    assert saved > 5
+    assert db.query(DocumentChunk).count() == saved
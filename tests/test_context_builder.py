@@ -0,0 +1,43 @@
+from app.services.context_builder import ContextBuilder, StreamingChunker, count_tokens
+
+def test_count_tokens_grows_with_text():
+    assert count_tokens("", model="llama2") == 0
+    assert count_tokens("Hola mundo.", model="llama2") >= 3
+    assert count_tokens("palabra " * 100, model="llama2") >= 100
+
+def test_short_document_is_used_whole():
+    builder = ContextBuilder(budget=1000, chunk_tokens=50, model="llama2")
+    content = "Python fue creado por Guido van Rossum.\n\nSe lanzó en 1991."
+    context = builder.build(content, "¿Quién creó Python?")
+    assert "Guido van Rossum" in context.text
+    assert "1991" in context.text
+    assert context.tokens <= 1000
+
+def test_large_document_fits_budget_and_keeps_relevant_chunk():
+    builder = ContextBuilder(budget=200, chunk_tokens=50, model="llama2")
+    filler = "\n\n".join(f"Párrafo {i} sobre cocina, recetas y ingredientes variados." for i in range(500))
+    content = filler + "\n\nEl número de pieza del rodamiento es XK-4471.\n\n" + filler
+    context = builder.build(content, "¿Cuál es el número de pieza del rodamiento?")
+    assert context.tokens <= 200
+    assert "XK-4471" in context.text
+    assert context.total_chunks > len(context.chunks)
+    ordinals = [chunk.ordinal for chunk in context.chunks]
+    assert ordinals == sorted(ordinals)
+
+def test_streaming_chunker_respects_structure():
+    chunker = StreamingChunker(chunk_tokens=40, overlap_tokens=10, model="llama2")
+    content = (
+        "# Introducción\n\n" + " ".join(f"Esta es la frase número {i}." for i in range(30))
+        + "\n\n## Tabla\n\n" + "\n".join(f"| fila {i} | valor {i} |" for i in range(20))
+    )
+    whole = list(chunker.chunks([content]))
+    pieces = list(chunker.chunks(content[i:i + 17] for i in range(0, len(content), 17)))
+    assert [(c.start, c.end) for c in pieces] == [(c.start, c.end) for c in whole]
+    for chunk in whole:
+        assert chunk.text == content[chunk.start:chunk.end]
+        assert chunk.tokens <= 40
+        # Nunca se corta una frase ni una fila de la tabla
+        assert chunk.text.rstrip().endswith((".", "|", "Introducción"))
+    assert any(chunk.text.startswith("## Tabla") for chunk in whole)
+    # Fragmentos consecutivos se solapan
+    assert whole[1].start < whole[0].end
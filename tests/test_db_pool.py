@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.db.pool import MeteredQueuePool, pool_stats
+
+def make_engine(tmp_path):
+    return create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MeteredQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.1,
+        pool_pre_ping=True
+    )
+
+def test_pool_metrics_count_overflow_and_timeouts(tmp_path):
+    engine = make_engine(tmp_path)
+    first = engine.connect()
+    second = engine.connect()
+    stats = pool_stats(engine.pool)
+    assert stats["checked_out"] == 2
+    assert stats["overflow"] == 1
+    assert stats["overflow_events"] == 1
+
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    assert pool_stats(engine.pool)["timeouts"] == 1
+    assert pool_stats(engine.pool)["max_wait_time"] >= 0.1
+
+    first.close()
+    second.close()
+    with engine.connect() as connection:
+        assert connection.execute(text("select 1")).scalar() == 1
+    stats = pool_stats(engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 3
+
+def test_pool_metrics_survive_dispose(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.connect() as connection:
+        connection.invalidate()
+    engine.dispose()
+    stats = pool_stats(engine.pool)
+    assert stats["checkouts"] == 1
+    assert stats["invalidated"] == 1
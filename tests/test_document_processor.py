@@ -0,0 +1,153 @@
+import io
+import os
+import pytest
+from celery.exceptions import TimeLimitExceeded
+from fastapi import HTTPException, UploadFile
+import app.db  # noqa: F401 - registra todos los modelos
+from app.models.document_blob import DocumentBlob
+from app.services import document_processor
+from app.services.document_processor import DocumentProcessor
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor.settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(document_processor.settings, "UPLOAD_CHUNK_SIZE", 4)
+    monkeypatch.setattr(document_processor.settings, "UPLOAD_MAX_SIZE", 64)
+    return tmp_path
+
+def make_upload(data: bytes, filename: str) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename)
+
+@pytest.mark.asyncio
+async def test_same_content_shares_path_and_leaves_no_temp_files(upload_dir):
+    uploads = [
+        await DocumentProcessor.save_upload(make_upload(data, filename))
+        for data, filename in [(b"hola mundo", "a.txt"), (b"hola mundo", "b.txt"), (b"adios mundo", "a.txt")]
+    ]
+    for _, tmp_path, file_path in uploads:
+        DocumentProcessor.place_upload(tmp_path, file_path)
+    first, second, other = uploads
+    assert first[0] == second[0] and first[2] == second[2]
+    assert other[2] != first[2]
+    assert sorted(p.name for p in upload_dir.iterdir()) == sorted([f"{first[0]}.txt", f"{other[0]}.txt"])
+
+@pytest.mark.asyncio
+async def test_upload_over_limit_is_rejected(upload_dir):
+    with pytest.raises(HTTPException) as error:
+        await DocumentProcessor.save_upload(make_upload(b"x" * 100, "big.txt"))
+    assert error.value.status_code == 413
+    assert list(upload_dir.iterdir()) == []
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data, filename", [
+    (b"no soy un pdf", "fake.pdf"),
+    (b"\x00\x01binario", "fake.txt"),
+    (b"%PDF-1.7", "file.exe"),
+])
+async def test_content_must_match_extension(upload_dir, data, filename):
+    with pytest.raises(HTTPException) as error:
+        await DocumentProcessor.save_upload(make_upload(data, filename))
+    assert error.value.status_code == 415
+
+class FakeAsyncSession:
+    """Lo justo de AsyncSession para register_upload, con un blob ya guardado."""
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.added = []
+
+    async def execute(self, statement):
+        blob = self.blob
+
+        class Result:
+            def scalars(self):
+                return self
+
+            def first(self):
+                return blob
+
+        return Result()
+
+    def add(self, item):
+        self.added.append(item)
+
+    async def commit(self):
+        pass
+
+async def register(upload_dir, blob, data=b"hola mundo"):
+    content_hash, tmp_path, file_path = await DocumentProcessor.save_upload(make_upload(data, "a.txt"))
+    if blob is not None:
+        blob.file_path = file_path
+    return await document_processor.register_upload(
+        FakeAsyncSession(blob), "a.txt", 7, content_hash, tmp_path, file_path
+    )
+
+@pytest.mark.asyncio
+async def test_failed_content_is_processed_again_on_upload(upload_dir):
+    blob = DocumentBlob(sha256="abc", status="failed", error="Ollama caído", ref_count=1)
+    document, needs_processing = await register(upload_dir, blob)
+    assert needs_processing
+    assert (blob.status, blob.error, blob.ref_count) == ("processing", None, 2)
+    assert document.blob is blob
+
+@pytest.mark.asyncio
+async def test_ready_content_is_reused_on_upload(upload_dir):
+    blob = DocumentBlob(sha256="abc", status="ready", ref_count=1)
+    _, needs_processing = await register(upload_dir, blob)
+    assert not needs_processing
+    assert blob.status == "ready"
+
+@pytest.mark.asyncio
+async def test_upload_restores_a_shared_file_deleted_by_release(upload_dir):
+    # release_document borró el fichero justo después de que save_upload terminara
+    blob = DocumentBlob(sha256="abc", status="failed", ref_count=1)
+    await register(upload_dir, blob)
+    assert [p.name for p in upload_dir.iterdir()] == [os.path.basename(blob.file_path)]
+    with open(blob.file_path, "rb") as f:
+        assert f.read() == b"hola mundo"
+
+class FakeTracker:
+    def __init__(self):
+        self.progress = {}
+
+    def update(self, content_hash, **fields):
+        self.progress.update(fields)
+
+def test_hard_time_limit_marks_content_failed(monkeypatch):
+    tracker = FakeTracker()
+    updates = []
+    monkeypatch.setattr(document_processor, "ProgressTracker", lambda: tracker)
+    monkeypatch.setattr(document_processor, "update_blob", lambda content_hash, **fields: updates.append(fields))
+    document_processor.extraction_failed_task.run(None, TimeLimitExceeded(90), None, "abc")
+    assert updates == [{"status": "failed", "error": "La extracción superó el límite de tiempo"}]
+    assert tracker.progress["status"] == "failed"
+
+def test_pdf_extraction_chord_has_an_error_callback(monkeypatch, tmp_path):
+    captured = {}
+
+    def fake_chord(header):
+        captured["header"] = list(header)
+        return lambda body: captured.setdefault("body", body)
+
+    class FakeQuery:
+        def filter(self, *args):
+            return self
+
+        def scalar(self):
+            return str(tmp_path / "abc.pdf")
+
+    class FakeSession:
+        def query(self, *args):
+            return FakeQuery()
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(document_processor, "chord", fake_chord)
+    monkeypatch.setattr(document_processor, "SessionLocal", FakeSession)
+    monkeypatch.setattr(document_processor, "ProgressTracker", FakeTracker)
+    monkeypatch.setattr(DocumentProcessor, "count_pdf_pages", staticmethod(lambda path: 3))
+    document_processor.process_document_task.run("abc", 7)
+    errbacks = captured["body"].options["link_error"]
+    assert [errback.task for errback in errbacks] == [document_processor.extraction_failed_task.name]
+    assert errbacks[0].args == ("abc",)
@@ -0,0 +1,51 @@
+import datetime
+import pytest
+from fastapi import HTTPException
+import app.db  # noqa: F401 - registra todos los modelos
+from app.api.documents import _decode_cursor, _encode_cursor, _ensure_ready, _progress_report
+from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+    cursor = _encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert _decode_cursor(cursor) == (created_at, 42)
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("no-es-un-cursor")
+    assert error.value.status_code == 400
+
+def test_progress_report_follows_redis_while_processing():
+    progress = {"status": "processing", "stage": "summarizing", "summary_stage": "map"}
+    report = _progress_report(7, progress, {})
+    assert report["status"] == "processing" and not report["summary_ready"]
+    progress.update(status="ready", stage="done", summary_stage="done")
+    report = _progress_report(7, progress, {})
+    assert report["status"] == "ready" and report["summary_ready"]
+
+def test_progress_report_falls_back_to_the_database():
+    report = _progress_report(7, {}, {"status": "failed", "error": "PDF dañado", "summary_ready": False})
+    assert report["status"] == "failed"
+    assert report["stage"] == "failed"
+    assert report["error"] == "PDF dañado"
+    assert report["summary_stage"] == "pending"
+
+@pytest.mark.parametrize("status", ["processing", "failed"])
+def test_questions_wait_until_the_document_is_ready(status):
+    document = Document(id=3, blob=DocumentBlob(sha256="abc", status=status))
+    with pytest.raises(HTTPException) as error:
+        _ensure_ready(document)
+    assert error.value.status_code == 409
+    assert error.value.detail["status"] == status
+    assert error.value.detail["status_url"].endswith("/documents/3/progress")
+
+def test_ready_document_accepts_questions():
+    _ensure_ready(Document(id=3, blob=DocumentBlob(sha256="abc", status="ready")))
+
+def test_document_schemas_hide_internal_path_and_content():
+    from app.schemas.document import Document as DocumentSchema, DocumentListItem
+    for schema in (DocumentSchema, DocumentListItem):
+        assert "file_path" not in schema.model_fields
+        assert "content" not in schema.model_fields
@@ -0,0 +1,52 @@
+import pytest
+from app.services.llm_cache import LLMCache
+
+@pytest.mark.asyncio
+async def test_hit_and_miss_counters():
+    cache = LLMCache(max_entries=10, ttl=60)
+    key = LLMCache.make_key("llama2", "1", "prompt")
+    assert await cache.get(key) is None
+    await cache.set(key, "respuesta")
+    assert await cache.get(key) == "respuesta"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    cache = LLMCache(max_entries=2, ttl=60)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    await cache.get("a")
+    await cache.set("c", "3")
+    assert await cache.get("b") is None
+    assert await cache.get("a") == "1"
+    assert await cache.get("c") == "3"
+
+@pytest.mark.asyncio
+async def test_ttl_expiration():
+    cache = LLMCache(max_entries=10, ttl=0)
+    await cache.set("a", "1")
+    assert await cache.get("a") is None
+
+@pytest.mark.asyncio
+async def test_invalidate_document():
+    cache = LLMCache(max_entries=10, ttl=60)
+    await cache.set("a", "1", document_id=1)
+    await cache.set("b", "2", document_id=2)
+    await cache.invalidate_document(1)
+    assert await cache.get("a") is None
+    assert await cache.get("b") == "2"
+
+@pytest.mark.asyncio
+async def test_evicted_and_expired_keys_leave_document_index():
+    cache = LLMCache(max_entries=2, ttl=60)
+    for i in range(100):
+        await cache.set(f"k{i}", "v", document_id=i)
+    assert len(cache._document_keys) == 2
+    assert len(cache._key_documents) == 2
+
+    expiring = LLMCache(max_entries=10, ttl=0)
+    await expiring.set("a", "1", document_id=1)
+    assert await expiring.get("a") is None
+    assert expiring._document_keys == {}
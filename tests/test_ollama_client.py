@@ -0,0 +1,101 @@
+import pytest
+import httpx
+from app.services.ollama_client import OllamaClient, OllamaError
+
+def make_client(handler, max_retries=2):
+    client = OllamaClient(
+        base_url="http://ollama.test",
+        model="llama2",
+        timeout=5,
+        max_retries=max_retries,
+        retry_delay=0
+    )
+    client._client = httpx.AsyncClient(
+        base_url=client.base_url,
+        transport=httpx.MockTransport(handler)
+    )
+    return client
+
+@pytest.mark.asyncio
+async def test_generate_returns_response():
+    def handler(request):
+        assert request.url.path == "/api/generate"
+        return httpx.Response(200, json={"response": "Guido van Rossum"})
+
+    client = make_client(handler)
+    assert await client.generate("¿Quién creó Python?") == "Guido van Rossum"
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_generate_retries_server_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"response": "ok"})
+
+    client = make_client(handler, max_retries=2)
+    assert await client.generate("hola") == "ok"
+    assert len(calls) == 3
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_generate_does_not_retry_client_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(404, text="model not found")
+
+    client = make_client(handler, max_retries=3)
+    with pytest.raises(OllamaError):
+        await client.generate("hola")
+    assert len(calls) == 1
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_generate_retries_connection_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 2:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"response": "ok"})
+
+    client = make_client(handler, max_retries=2)
+    assert await client.generate("hola") == "ok"
+    assert len(calls) == 2
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_generate_does_not_retry_read_timeouts():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    client = make_client(handler, max_retries=3)
+    with pytest.raises(OllamaError):
+        await client.generate("hola")
+    assert len(calls) == 1
+    await client.aclose()
+
+@pytest.mark.asyncio
+async def test_stream_yields_tokens_until_done():
+    lines = [
+        '{"response": "Guido", "done": false}',
+        '{"response": " van Rossum", "done": false}',
+        '{"response": "", "done": true}',
+    ]
+
+    def handler(request):
+        return httpx.Response(200, content="\n".join(lines).encode())
+
+    client = make_client(handler)
+    tokens = [token async for token in client.stream("¿Quién creó Python?")]
+    assert tokens == ["Guido", " van Rossum"]
+    await client.aclose()
@@ -0,0 +1,72 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.services.document_processor import DocumentProcessor
+from app.services.chunk_store import PAGE_SEPARATOR
+
+def write_pdf(path, pages):
+    """PDF mínimo con una línea de texto por página."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects),)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+def test_page_ranges_match_sequential_extraction(tmp_path):
+    # Lo que hace el chord de extract_pages_task: rangos sueltos que se concatenan en orden
+    path = tmp_path / "doc.pdf"
+    write_pdf(path, [f"Pagina {i} del documento" for i in range(1, 8)])
+    total = DocumentProcessor.count_pdf_pages(str(path))
+    pages = [
+        page
+        for start in range(0, total, 2)
+        for page in DocumentProcessor.extract_pdf_pages(str(path), start, start + 2)
+    ]
+    assert total == 7
+    assert pages == DocumentProcessor.extract_pdf_pages(str(path), 0, 7)
+    assert "Pagina 5 del documento" in pages[4]
+
+def test_benchmark_1000_page_pdf(tmp_path):
+    path = tmp_path / "largo.pdf"
+    write_pdf(path, [f"Pagina {i} " + "texto de relleno " * 20 for i in range(1000)])
+
+    start = time.perf_counter()
+    sequential = DocumentProcessor.extract_text(str(path))
+    sequential_time = time.perf_counter() - start
+
+    # Cuatro procesos hacen de cuatro workers de Celery con rangos de 250 páginas
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+        starts = range(0, 1000, 250)
+        list(executor.map(DocumentProcessor.count_pdf_pages, [str(path)] * 4))
+        begin = time.perf_counter()
+        ranges = executor.map(
+            DocumentProcessor.extract_pdf_pages, [str(path)] * 4, starts, [s + 250 for s in starts]
+        )
+        pages = [page for pages in ranges for page in pages]
+        parallel_time = time.perf_counter() - begin
+    print(f"PDF 1000 páginas: secuencial {sequential_time:.2f} s, por rangos (4 procesos) {parallel_time:.2f} s")
+
+    assert len(pages) == 1000
+    assert "".join(page + PAGE_SEPARATOR for page in pages) == sequential
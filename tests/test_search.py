@@ -0,0 +1,43 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+import app.db  # noqa: F401 - registra todos los modelos
+from app.db.fulltext import tsvector_sql
+from app.models.document import Document
+from app.models.document_blob import DocumentBlob
+from app.models.document_chunk import DocumentChunk
+from app.services.search import build_search_query
+
+def compile_pg(clause) -> str:
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+def test_tsvector_sql_indexes_every_language():
+    sql = tsvector_sql("content", "B", 1000)
+    assert "to_tsvector('spanish', left(coalesce(content, ''), 1000))" in sql
+    assert "to_tsvector('english', left(coalesce(content, ''), 1000))" in sql
+    assert sql.count("setweight(") == 2
+
+def test_search_vectors_are_generated_columns_with_gin_indexes():
+    blobs = compile_pg(CreateTable(DocumentBlob.__table__))
+    documents = compile_pg(CreateTable(Document.__table__))
+    assert "search_vector TSVECTOR GENERATED ALWAYS AS" in blobs
+    assert "search_vector TSVECTOR GENERATED ALWAYS AS" in compile_pg(CreateTable(DocumentChunk.__table__))
+    assert "title_vector TSVECTOR GENERATED ALWAYS AS" in documents
+    indexes = [compile_pg(CreateIndex(index)) for index in [*DocumentBlob.__table__.indexes, *Document.__table__.indexes]]
+    assert any("USING gin (search_vector)" in index for index in indexes)
+    assert any("USING gin (title_vector)" in index for index in indexes)
+
+def test_search_query_ranks_in_sql_and_only_returns_snippets():
+    query = build_search_query(owner_id=7, text="informe anual", limit=20)
+    sql = compile_pg(query)
+    assert "websearch_to_tsquery" in sql and "@@" in sql
+    assert "ts_rank_cd" in sql and "ts_headline" in sql
+    assert [column.name for column in query.selected_columns] == ["id", "title", "created_at", "rank", "snippet"]
+
+def test_search_matches_through_a_union_and_snippets_come_from_chunks():
+    sql = compile_pg(build_search_query(owner_id=7, text="informe anual", limit=20))
+    assert " UNION " in sql
+    assert "documents.title_vector @@" in sql and "document_blobs.search_vector @@" in sql
+    assert " OR document_blobs" not in sql
+    # ts_headline recorre un fragmento, no el contenido completo
+    assert "ts_headline(%(ts_headline_1)s::REGCONFIG, anon_2.text" in sql
+    assert "document_blobs.content" not in sql
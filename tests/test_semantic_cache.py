@@ -0,0 +1,38 @@
+import time
+import numpy as np
+from app.services.semantic_cache import SemanticCache
+
+def test_returns_answer_for_similar_question():
+    cache = SemanticCache(threshold=0.9)
+    cache.add(1, [1.0, 0.0, 0.0], "Guido van Rossum")
+    assert cache.lookup(1, [0.98, 0.05, 0.0]) == "Guido van Rossum"
+    assert cache.lookup(1, [0.0, 1.0, 0.0]) is None
+
+def test_lookup_is_scoped_to_document():
+    cache = SemanticCache(threshold=0.9)
+    cache.add(1, [1.0, 0.0], "respuesta")
+    assert cache.lookup(2, [1.0, 0.0]) is None
+    cache.invalidate_document(1)
+    assert cache.lookup(1, [1.0, 0.0]) is None
+
+def test_max_per_document_drops_oldest():
+    cache = SemanticCache(threshold=0.99, max_per_document=2)
+    cache.add(1, [1.0, 0.0, 0.0], "a")
+    cache.add(1, [0.0, 1.0, 0.0], "b")
+    cache.add(1, [0.0, 0.0, 1.0], "c")
+    assert cache.lookup(1, [1.0, 0.0, 0.0]) is None
+    assert cache.lookup(1, [0.0, 1.0, 0.0]) == "b"
+    assert cache.lookup(1, [0.0, 0.0, 1.0]) == "c"
+
+def test_lookup_latency_with_thousands_of_questions():
+    rng = np.random.default_rng(0)
+    cache = SemanticCache(threshold=0.99)
+    vectors = rng.standard_normal((5000, 768)).astype(np.float32)
+    for i, vector in enumerate(vectors):
+        cache.add(1, vector, str(i))
+    start = time.perf_counter()
+    for _ in range(100):
+        cache.lookup(1, vectors[1234])
+    elapsed = (time.perf_counter() - start) / 100
+    assert cache.lookup(1, vectors[1234]) == "1234"
+    print(f"Búsqueda media sobre 5000 preguntas: {elapsed * 1000:.3f} ms")
@@ -0,0 +1,159 @@
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_generation():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "respuesta"
+
+    results = await asyncio.gather(*[flights.do("clave", generate) for _ in range(10)])
+    assert results == ["respuesta"] * 10
+    assert len(calls) == 1
+    assert flights.stats()["coalesced"] == 9
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("Ollama caído")
+
+    results = await asyncio.gather(
+        *[flights.do("clave", fail) for _ in range(3)],
+        return_exceptions=True
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def generate():
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return "respuesta"
+
+    leader = asyncio.create_task(flights.do("clave", generate))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flights.do("clave", generate))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == "respuesta"
+    assert leader.cancelled()
+    assert not cancelled
+
+@pytest.mark.asyncio
+async def test_generation_is_cancelled_when_every_caller_leaves():
+    flights = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def generate():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "respuesta"
+
+    callers = [asyncio.create_task(flights.do("clave", generate)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert flights.stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_stream_subscribers_share_tokens():
+    flights = SingleFlight()
+    calls = []
+
+    async def tokens():
+        calls.append(1)
+        for token in ["Guido", " van", " Rossum"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def consume():
+        return "".join([t async for t in flights.stream("clave", tokens)])
+
+    results = await asyncio.gather(consume(), consume(), consume())
+    assert results == ["Guido van Rossum"] * 3
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_stream_is_cancelled_when_all_subscribers_leave():
+    flights = SingleFlight()
+    closed = asyncio.Event()
+
+    async def tokens():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        finally:
+            closed.set()
+
+    stream = flights.stream("clave", tokens)
+    assert await stream.__anext__() == "x"
+    await stream.aclose()
+    await asyncio.wait_for(closed.wait(), timeout=1)
+
+class FakeRedis:
+    """Lo justo de Redis para el lock del líder: SET NX, PUBLISH y el script de borrado."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def publish(self, channel, message):
+        return 0
+
+    def register_script(self, script):
+        async def release(keys, args):
+            if self.values.get(keys[0]) == args[0]:
+                del self.values[keys[0]]
+                return 1
+            return 0
+        return release
+
+@pytest.mark.asyncio
+async def test_slow_leader_does_not_release_a_lock_taken_by_another_worker():
+    redis = FakeRedis()
+    flights = SingleFlight(redis_client=redis, lock_ttl=1)
+    lock_key = SingleFlight._lock_key("clave")
+
+    async def generate():
+        # El lock caducó durante la generación y otro worker lo tomó
+        redis.values[lock_key] = "token-de-otro-worker"
+        return "respuesta"
+
+    assert await flights.do("clave", generate) == "respuesta"
+    assert redis.values[lock_key] == "token-de-otro-worker"
+
+@pytest.mark.asyncio
+async def test_leader_releases_its_own_lock():
+    redis = FakeRedis()
+    flights = SingleFlight(redis_client=redis)
+
+    async def generate():
+        return "respuesta"
+
+    assert await flights.do("clave", generate) == "respuesta"
+    assert redis.values == {}
@@ -0,0 +1,98 @@
+import pytest
+from app.services import summarization
+from app.services.context_builder import ContextChunk
+
+class FakeTracker:
+    def __init__(self):
+        self.checkpoints = {}
+        self.progress = {}
+
+    def update(self, document_id, **fields):
+        self.progress.update(fields)
+
+    def increment(self, document_id, field, amount=1):
+        self.progress[field] = self.progress.get(field, 0) + amount
+
+    def save_checkpoint(self, document_id, stage, index, value):
+        self.checkpoints[(stage, index)] = value
+
+    def load_checkpoint(self, document_id, stage, index):
+        return self.checkpoints.get((stage, index))
+
+    def clear_checkpoints(self, document_id):
+        self.checkpoints.clear()
+
+class FakeLLMService:
+    def __init__(self):
+        self.calls = []
+
+    async def combine_summaries(self, summaries, user_id=None):
+        self.calls.append(list(summaries))
+        return "(" + "+".join(summaries) + ")"
+
+class FakeSession:
+    def query(self, model):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def first(self):
+        return None
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def fakes(monkeypatch):
+    tracker = FakeTracker()
+    llm_service = FakeLLMService()
+    monkeypatch.setattr(summarization, "ProgressTracker", lambda: tracker)
+    monkeypatch.setattr(summarization, "init_llm_service", lambda: llm_service)
+    monkeypatch.setattr(summarization, "SessionLocal", FakeSession)
+    monkeypatch.setattr(summarization.settings, "SUMMARY_REDUCE_FANOUT", 3)
+    return tracker, llm_service
+
+def test_group_for_summary_skips_overlap():
+    content = "uno dos tres cuatro cinco seis"
+    spans = [(0, 12), (8, 25), (20, 30)]
+    chunks = [ContextChunk(ordinal=i, start=s, end=e, text=content[s:e], tokens=1) for i, (s, e) in enumerate(spans)]
+    assert summarization.group_for_summary(chunks, size=20) == ["uno dos tres", " cuatro cinco\n\n seis"]
+
+def test_reduce_is_hierarchical(fakes):
+    tracker, llm_service = fakes
+    summaries = [str(i) for i in range(7)]
+    result = summarization.reduce_summaries_task.run(summaries, 1)
+    assert result == "((0+1+2)+(3+4+5)+(6))"
+    assert len(llm_service.calls) == 4
+    assert tracker.progress["summary_stage"] == "done"
+
+def test_reduce_resumes_from_checkpoints(fakes):
+    tracker, llm_service = fakes
+    tracker.checkpoints[("reduce:1", 0)] = "A"
+    tracker.checkpoints[("reduce:1", 1)] = "B"
+    result = summarization.reduce_summaries_task.run([str(i) for i in range(7)], 1)
+    assert result == "(A+B+(6))"
+    assert llm_service.calls[0] == ["6"]
+
+def test_chord_failure_marks_content_failed(fakes, monkeypatch):
+    tracker, _ = fakes
+    updates = []
+    monkeypatch.setattr(summarization, "update_blob", lambda content_hash, **fields: updates.append(fields))
+    summarization.summary_failed_task.run(None, RuntimeError("ollama caído"), None, "abc")
+    assert updates[0]["status"] == "failed"
+    assert tracker.progress["status"] == "failed"
+    assert "ollama caído" in tracker.progress["error"]
+
+def test_pipeline_attaches_error_callback(fakes, monkeypatch):
+    captured = {}
+
+    def fake_chord(header):
+        captured["header"] = list(header)
+        return lambda body: captured.setdefault("body", body)
+
+    monkeypatch.setattr(summarization, "chord", fake_chord)
+    summarization.start_summary_pipeline("abc", ["uno", "dos"], 1)
+    errbacks = captured["body"].options["link_error"]
+    assert [errback.task for errback in errbacks] == [summarization.summary_failed_task.name]
+    assert errbacks[0].args == ("abc",)
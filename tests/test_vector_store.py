@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from app.services.vector_store import VectorStore
+
+@pytest.fixture(params=["int8", "float16"])
+def store(request, tmp_path):
+    return VectorStore(directory=str(tmp_path), dtype=request.param, batch_rows=3)
+
+def test_search_returns_most_similar_chunks(store):
+    store.save(1, 7, np.eye(4))
+    assert store.exists(1, 7)
+    assert store.count(1, 7) == 4
+    results = store.search(1, 7, [0.1, 0.0, 0.9, 0.0], k=2)
+    assert [ordinal for ordinal, _ in results] == [2, 0]
+    assert results[0][1] > results[1][1]
+
+def test_appends_are_scoped_per_document(store):
+    rng = np.random.default_rng(0)
+    a, b = rng.standard_normal((10, 16)), rng.standard_normal((5, 16))
+    store.save(1, 1, a)
+    store.save(1, 2, b)
+    results = store.search(1, 2, b[3], k=1)
+    assert results[0][0] == 3
+    assert results[0][1] == pytest.approx(1.0, abs=0.02)
+
+def test_search_all_maps_rows_to_documents(store):
+    rng = np.random.default_rng(2)
+    a, b, c = (rng.standard_normal((n, 16)) for n in (4, 6, 3))
+    store.save(1, 1, a)
+    store.save(1, 2, b)
+    store.save(1, 3, c)
+    assert store.search_all(1, b[4], k=1)[0][:2] == (2, 4)
+    assert store.search_all(1, c[2], k=1)[0][:2] == (3, 2)
+    results = store.search_all(1, b[4], k=5, document_ids=[1, 3])
+    assert {document_id for document_id, _, _ in results} <= {1, 3}
+
+def test_delete_compacts_rows(store, tmp_path):
+    rng = np.random.default_rng(1)
+    a, b = rng.standard_normal((10, 16)), rng.standard_normal((5, 16))
+    store.save(1, 1, a)
+    store.save(1, 2, b)
+    store.delete(1, 1)
+    header = store.read_header(1)
+    assert header["count"] == 5
+    assert header["documents"] == {"2": [0, 5]}
+    assert not store.exists(1, 1)
+    assert store.search(1, 2, b[0], k=1)[0][0] == 0
+    assert len(list((tmp_path / "1").glob("vectors.*.bin"))) == 1
+
+def test_int8_store_is_compact(tmp_path):
+    store = VectorStore(directory=str(tmp_path), dtype="int8")
+    store.save(1, 1, np.random.default_rng(2).standard_normal((100, 768)))
+    assert (tmp_path / "1" / "vectors.0.bin").stat().st_size == 100 * 768
+
+def test_blob_artifacts_are_shared_by_content(store):
+    vectors = np.random.default_rng(3).standard_normal((6, 16))
+    store.save_embeddings("abc", vectors)
+    # Dos usuarios con el mismo contenido reciben las filas sin volver a calcularlas
+    for user_id in (1, 2):
+        store.save(user_id, 10 + user_id, store.load_embeddings("abc"))
+        assert store.search(user_id, 10 + user_id, vectors[4], k=1)[0][0] == 4
+    store.delete_blob("abc")
+    assert store.load_embeddings("abc") is None